@@ -286,6 +286,7 @@ pv.plot_params_diff(df_meta,
                     dic_trt_meaning,
                     long_label=False,
                     plot_params_dict=plot_params_dict,
+                    working_dir=working_dir,
                     )
 
 
@@ -0,0 +1,169 @@
+''' Asyncio counterparts of the database querying and ingestion functions.
+
+    The synchronous functions are run on a managed thread pool with a bounded number of
+    workers (GLOBAL['ASYNC_MAX_WORKERS']) so that many querries can be in flight without
+    blocking the event loop of an asyncio service or of a Jupyter kernel.
+
+    Example (in a Jupyter cell):
+        list_files = await pv.sieve_files_async(list_irr, list_trt, list_mod, database_path)
+        list_data = await pv.read_flashtest_files_async(list_files)
+'''
+
+__all__ = [
+    "add_exp_to_database_async",
+    "build_metadata_dataframe_async",
+    "build_metadata_df_from_db_async",
+    "read_flashtest_files_async",
+    "set_async_max_workers",
+    "shutdown_async_executor",
+    "sieve_files_async",
+]
+
+#Internal imports
+from .config import GLOBAL
+
+_EXECUTOR = None
+_MAX_WORKERS = None
+
+def set_async_max_workers(max_workers):
+
+    '''Sets the maximum number of concurrent workers of the managed executor.
+    The running executor, if any, is shut down and replaced at the next call.
+
+    Args:
+        max_workers (int): maximum number of concurrent workers
+    '''
+
+    global _MAX_WORKERS
+
+    shutdown_async_executor()
+    _MAX_WORKERS = max_workers
+
+def shutdown_async_executor(wait=True):
+
+    '''Shuts down the managed executor.
+
+    Args:
+        wait (bool): if True waits for the pending jobs to be completed (default: True)
+    '''
+
+    global _EXECUTOR
+
+    if _EXECUTOR is not None:
+        _EXECUTOR.shutdown(wait=wait)
+        _EXECUTOR = None
+
+def _get_executor():
+
+    '''Returns the managed executor, creating it if necessary.
+    '''
+
+    # Standard library imports
+    from concurrent.futures import ThreadPoolExecutor
+
+    global _EXECUTOR
+
+    if _EXECUTOR is None:
+        max_workers = _MAX_WORKERS if _MAX_WORKERS is not None else GLOBAL['ASYNC_MAX_WORKERS']
+        _EXECUTOR = ThreadPoolExecutor(max_workers=max_workers,
+                                       thread_name_prefix='PVcharacterization')
+    return _EXECUTOR
+
+async def _run(func, *args, **kwargs):
+
+    '''Runs func(*args, **kwargs) on the managed executor and awaits its result.
+    '''
+
+    # Standard library imports
+    import asyncio
+    import functools
+
+    loop = asyncio.get_running_loop()
+
+    return await loop.run_in_executor(_get_executor(), functools.partial(func, *args, **kwargs))
+
+async def sieve_files_async(irradiance_select, treatment_select, module_type_select, database_path):
+
+    '''Asyncio counterpart of sieve_files.
+    '''
+
+    # Internal imports
+    from .PVcharacterization_database import sieve_files
+
+    return await _run(sieve_files, irradiance_select, treatment_select, module_type_select, database_path)
+
+async def build_metadata_df_from_db_async(working_dir, list_mod_selected, list_irradiance, exclude_suspect=False):
+
+    '''Asyncio counterpart of build_metadata_df_from_db.
+    '''
+
+    # Internal imports
+    from .PVcharacterization_flashtest import build_metadata_df_from_db
+
+    return await _run(build_metadata_df_from_db, working_dir, list_mod_selected, list_irradiance,
+                      exclude_suspect=exclude_suspect)
+
+async def read_flashtest_files_async(list_files, parse_all=True, warning=False):
+
+    '''Reads concurrently a batch of flashtest files with read_flashtest_file.
+
+    Args:
+        list_files (list): list of the full path of the files
+        parse_all (boolean): see read_flashtest_file
+        warning (boolean): see read_flashtest_file
+
+    Returns:
+        (list of namedtuples): the results of read_flashtest_file in the order of list_files.
+    '''
+
+    # Standard library imports
+    import asyncio
+
+    # Internal imports
+    from .PVcharacterization_flashtest import read_flashtest_file
+
+    return await asyncio.gather(*[_run(read_flashtest_file, file, parse_all=parse_all, warning=warning)
+                                  for file in list_files])
+
+async def build_metadata_dataframe_async(working_dir, interactive=False):
+
+    '''Asyncio counterpart of build_metadata_dataframe. If interactive is True the modules are selected
+    with the tkinter dialog on the thread of the event loop, which must be the main thread as tkinter
+    does not support the other threads, before the dataframe is built on the managed executor.
+    '''
+
+    # Standard library imports
+    import threading
+
+    # Internal imports
+    from .PVcharacterization_database import catalog_module_types
+    from .PVcharacterization_flashtest import (_build_metadata_dataframe,
+                                               build_metadata_dataframe,
+                                               build_modules_filenames,)
+    from .PVcharacterization_GUI import select_items
+
+    if not interactive:
+        return await _run(build_metadata_dataframe, working_dir, interactive=False)
+
+    if threading.current_thread() is not threading.main_thread():
+        raise Exception("Sorry, the interactive selection requires an event loop running on the main thread")
+
+    list_mod_selected = select_items(await _run(catalog_module_types, working_dir),
+                                     'Select the modules type',
+                                     mode = 'multiple')
+
+    def build(): # Same steps as build_metadata_dataframe once the modules are selected
+        list_files_path = build_modules_filenames(list_mod_selected, working_dir)
+        return _build_metadata_dataframe(list_files_path, working_dir)
+
+    return await _run(build)
+
+async def add_exp_to_database_async(working_dir, new_data_folder, reject_noisy_flash=False):
+
+    '''Asyncio counterpart of add_exp_to_database.
+    '''
+
+    # Internal imports
+    from .PVcharacterization_flashtest import add_exp_to_database
+
+    return await _run(add_exp_to_database, working_dir, new_data_folder, reject_noisy_flash=reject_noisy_flash)
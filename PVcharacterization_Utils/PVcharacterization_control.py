@@ -67,7 +67,7 @@ def parse_filename_test_control(file,warning=False):
         
     return FileInfo
 
-def build_df_meta_test_control(list_files): 
+def build_df_meta_test_control(list_files, workers=None, chunk_size=None, progress=None, working_dir=None): 
     ''' 
     build_df_meta is the master function used to build the dataframe df_meta.
     df_meta has index= module name and columns = `exp_idx` , GLOBAL['COL_NAMES'], `Isc_corr`, `Fill_Factor_corr`, `date`,
@@ -82,67 +82,24 @@ def build_df_meta_test_control(list_files):
     
     Args:
         list_files (list): list of files used to build the df_meta dataframe
+        workers (int): number of worker processes, see build_df_meta
+        chunk_size (int): number of files processed by a worker in one go, see build_df_meta
+        progress (function): callback progress(nbr_files_done, nbr_files), see build_df_meta
+        working_dir (path): path of the folder holding the database used as store, see build_df_meta
     
     Returns:
         A dataframe containing the metadata (columns) of the list of experiences (rows)
     '''
- 
-    # Standard library imports 
-    import os
-    
-    #3rd party imports
-    import numpy as np
-    import pandas as pd
     
     #Internal import
-    from PVcharacterization_Utils.config import GLOBAL
-    from PVcharacterization_Utils.PVcharacterization_flashtest import read_flashtest_file
-    from PVcharacterization_Utils.PVcharacterization_flashtest import correct_iv_curve
-    from PVcharacterization_Utils.PVcharacterization_flashtest import parse_filename
-    
-    
-    COL_NAMES = GLOBAL['COL_NAMES']
-    
-    # Building of the dataframe df_meta out of the flashtest files 
-    isc_corr = []
-    fill_factor_corr = []
-    list_files_name = []  # List of files basenames without extension
-    list_dict_metadata = []
-    list_exp_id = []
-    list_date =[]
-    list_measure = []
-    list_module_type = []
-    
-    for file in list_files:
-        iv_info = read_flashtest_file(file, parse_all=True)
-        list_dict_metadata.append(iv_info.meta_data)
-      
-        
-        # Compure the corrected Isc current and Fill Factor out of the I/V curves
-        voltage = iv_info.IV0["Voltage"]
-        current = iv_info.IV0["Current"]
-        corrected_current = correct_iv_curve(voltage,current)
-        isc_corr.append(np.round(corrected_current[0],3))
-        fill_factor_corr.append(np.round(max(voltage*current)/(corrected_current[0]*max(voltage)),3))
-        list_files_name.append(os.path.splitext(os.path.basename(file))[0])
-        
-        # Add exp_id, irradiance, treatment, module_type from the filename prsing 
-        file_info = parse_filename_test_control(file)
-        list_exp_id.append(file_info.exp_id)
-        list_date.append(file_info.date)
-        list_measure.append(file_info.exp_num)
-        list_module_type.append(file_info.module_type)
-        
-        
-    df_meta = pd.DataFrame.from_dict(list_dict_metadata)
-    df_meta.index = list_files_name    #df_meta['ID']
-    df_meta = df_meta.loc[:,COL_NAMES] # keep only the columns which names COL_NAMES 
-                                       #  defined in PVcharacterization_GUI.py
-    df_meta['Isc_corr'] = isc_corr
-    df_meta['Fill Factor_corr'] = fill_factor_corr
-    df_meta['date'] = list_date
-    df_meta['exp_num'] = list_measure
-    df_meta['module_type'] = list_module_type
-    df_meta.insert(0, "exp_id", list_exp_id)
+    from PVcharacterization_Utils.PVcharacterization_flashtest import _build_df_meta
+    
+    df_meta = _build_df_meta(list_files,
+                             parse_filename_test_control,
+                             {'date': 'date', 'exp_num': 'exp_num', 'module_type': 'module_type'},
+                             workers=workers,
+                             chunk_size=chunk_size,
+                             progress=progress,
+                             working_dir=working_dir)
     
     return df_meta
\ No newline at end of file
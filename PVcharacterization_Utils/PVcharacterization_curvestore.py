@@ -0,0 +1,244 @@
+''' Creation: 2022.10.19
+    Last update: 2022.10.19
+
+    Consolidated on-disk store of the I/V curves of the archive. The voltages and the currents of all
+    the sweeps (IV0, IV1, IV2) of all the experiments are concatenated in two flat little-endian float64
+    files of the folder working_dir/CURVE_STORE_DIR which are memory-mapped when read. The table
+    DATA_BASE_TABLE_CURVES of the database holds the index (exp_id, sweep, start, stop) of the curves in
+    the flat arrays and the mean reference cell irradiance ref_cell_irradiance of each sweep. The store is append only: the new experiments are added by update_curve_store and
+    build_curve_store rebuilds it from scratch.
+
+    Example:
+        curves = pv.load_iv_curves(working_dir, list_exp_id, sweep='IV0')
+        voltage, current = pv.pack_iv_curves(curves.voltage, curves.current)
+        df_curves = pv.load_resampled_iv_curves(working_dir, list_exp_id, normalize='voc')
+'''
+
+__all__ = [
+    "build_curve_store",
+    "load_iv_curves",
+    "load_resampled_iv_curves",
+    "update_curve_store",
+]
+
+#Internal imports
+from .config import GLOBAL
+from .PVcharacterization_database import (_connect,
+                                          _database_path,
+                                          ingestion_lock,)
+
+SWEEPS = ('IV0', 'IV1', 'IV2')
+
+def _curve_store_paths(working_dir):
+
+    '''Returns the paths of the flat voltage and current files of the store.
+    '''
+
+    # Standard library imports
+    from pathlib import Path
+
+    store_dir = Path(working_dir) / Path(GLOBAL['CURVE_STORE_DIR'])
+
+    return store_dir / Path('voltage.f8'), store_dir / Path('current.f8')
+
+def build_curve_store(working_dir):
+
+    '''Rebuilds the curve store out of all the files of the table DATA_BASE_TABLE_FILE.
+
+    Args:
+        working_dir (path): path of the folder holding the database
+    '''
+
+    # Standard library imports
+    import os
+
+    DATA_BASE_TABLE_CURVES = GLOBAL['DATA_BASE_TABLE_CURVES']
+
+    with ingestion_lock(working_dir):
+        for path in _curve_store_paths(working_dir):
+            if os.path.exists(path): os.remove(path)
+        conn = _connect(_database_path(working_dir))
+        with conn:
+            conn.execute(f"DROP TABLE IF EXISTS {DATA_BASE_TABLE_CURVES}")
+        conn.close()
+        update_curve_store(working_dir)
+
+def update_curve_store(working_dir, list_exp_id=None):
+
+    '''Appends to the curve store the curves of the experiments of the table DATA_BASE_TABLE_FILE
+    which are not yet stored.
+
+    Args:
+        working_dir (path): path of the folder holding the database
+        list_exp_id (list of str): experiments to be added (default: None, all the missing experiments)
+
+    Returns:
+        (list of str): the list of the added exp_id.
+    '''
+
+    # Standard library imports
+    import os
+
+    #Internal imports
+    from .PVcharacterization_flashtest import read_flashtest_file
+
+    DATA_BASE_TABLE_FILE = GLOBAL['DATA_BASE_TABLE_FILE']
+    DATA_BASE_TABLE_CURVES = GLOBAL['DATA_BASE_TABLE_CURVES']
+
+    voltage_path, current_path = _curve_store_paths(working_dir)
+
+    with ingestion_lock(working_dir):
+        conn = _connect(_database_path(working_dir))
+        conn.execute(f'''CREATE TABLE IF NOT EXISTS {DATA_BASE_TABLE_CURVES}
+                         (exp_id TEXT, sweep TEXT, start INTEGER, stop INTEGER, ref_cell_irradiance REAL)''')
+        table_cols = [x[1] for x in conn.execute(f"PRAGMA table_info({DATA_BASE_TABLE_CURVES})").fetchall()]
+        if 'ref_cell_irradiance' not in table_cols: # Store built before the irradiance was recorded
+            conn.execute(f"ALTER TABLE {DATA_BASE_TABLE_CURVES} ADD COLUMN ref_cell_irradiance REAL")
+        conn.execute(f'''CREATE UNIQUE INDEX IF NOT EXISTS idx_{DATA_BASE_TABLE_CURVES}_exp_id_sweep
+                         ON {DATA_BASE_TABLE_CURVES} (exp_id, sweep)''')
+        querry = f'''SELECT exp_id, file_full_path FROM {DATA_BASE_TABLE_FILE}
+                     WHERE exp_id NOT IN (SELECT exp_id FROM {DATA_BASE_TABLE_CURVES})'''
+        list_rows = conn.execute(querry).fetchall()
+        if list_exp_id is not None:
+            set_exp_id = set(list_exp_id)
+            list_rows = [row for row in list_rows if row[0] in set_exp_id]
+
+        # The flat files are written first; the curves are visible only once the index is committed
+        os.makedirs(voltage_path.parent, exist_ok=True)
+        list_index = []
+        with open(voltage_path, 'ab') as voltage_file, open(current_path, 'ab') as current_file:
+            offset = voltage_file.tell() // 8
+            if current_file.tell() != 8 * offset:
+                conn.close()
+                raise Exception(f"Sorry, the curve store {voltage_path.parent} is corrupted. Please rebuild it with build_curve_store")
+            for exp_id, file in list_rows:
+                iv_info = read_flashtest_file(file, parse_all=True)
+                for sweep in SWEEPS:
+                    voltage = getattr(iv_info, sweep)["Voltage"].to_numpy(dtype='<f8')
+                    current = getattr(iv_info, sweep)["Current"].to_numpy(dtype='<f8')
+                    voltage_file.write(voltage.tobytes())
+                    current_file.write(current.tobytes())
+                    ref_cell = getattr(iv_info, f'Ref_Cell{sweep[-1]}')
+                    irradiance = ref_cell["Ref_Cell"].mean() if ref_cell is not None else None
+                    list_index.append((exp_id, sweep, offset, offset + len(voltage), irradiance))
+                    offset += len(voltage)
+            for store_file in (voltage_file, current_file):
+                store_file.flush()
+                os.fsync(store_file.fileno())
+
+        with conn: # Single transaction
+            conn.executemany(f'''INSERT INTO {DATA_BASE_TABLE_CURVES}
+                                 (exp_id, sweep, start, stop, ref_cell_irradiance) VALUES (?,?,?,?,?)''',
+                             list_index)
+        conn.close()
+
+    return [row[0] for row in list_rows]
+
+def load_iv_curves(working_dir, list_exp_id=None, sweep='IV0'):
+
+    '''Loads curves out of the curve store. The returned arrays are zero-copy read only views
+    of the memory-mapped store.
+
+    Args:
+        working_dir (path): path of the folder holding the database
+        list_exp_id (list of str): experiments to be loaded (default: None, all the stored experiments)
+        sweep (str): IV0, IV1 or IV2 (default: IV0)
+
+    Returns:
+        (namedtuple): IVCurves(exp_id, voltage, current) where exp_id is the list of the loaded exp_id,
+        in the order of list_exp_id, and voltage, current the lists of their voltage and current arrays.
+        The experiments missing in the store are skipped.
+    '''
+
+    # Standard library imports
+    from collections import namedtuple
+    import os
+
+    # 3rd party imports
+    import numpy as np
+
+    DATA_BASE_TABLE_CURVES = GLOBAL['DATA_BASE_TABLE_CURVES']
+
+    IVCurves = namedtuple('IVCurves', 'exp_id voltage current')
+
+    if sweep not in SWEEPS:
+        raise Exception(f"Sorry, the sweep must be one of {', '.join(SWEEPS)}")
+
+    conn = _connect(_database_path(working_dir))
+    list_index = conn.execute(f"SELECT exp_id, start, stop FROM {DATA_BASE_TABLE_CURVES} WHERE sweep=?",
+                              (sweep,)).fetchall()
+    conn.close()
+    dict_index = {exp_id: (start, stop) for exp_id, start, stop in list_index}
+    if list_exp_id is None:
+        list_exp_id = [x[0] for x in list_index]
+    list_exp_id = [exp_id for exp_id in list_exp_id if exp_id in dict_index]
+
+    voltage_path, current_path = _curve_store_paths(working_dir)
+    if not list_exp_id or os.path.getsize(voltage_path) == 0:
+        return IVCurves([], [], [])
+
+    voltage = np.memmap(voltage_path, dtype='<f8', mode='r')
+    current = np.memmap(current_path, dtype='<f8', mode='r')
+    list_slices = [slice(*dict_index[exp_id]) for exp_id in list_exp_id]
+
+    return IVCurves(list_exp_id,
+                    [voltage[x] for x in list_slices],
+                    [current[x] for x in list_slices])
+
+def load_resampled_iv_curves(working_dir, list_exp_id=None, grid=None, sweep='IV0', normalize=None):
+
+    '''Loads curves out of the curve store and interpolates them on a common voltage grid
+    (see resample_iv_curves).
+
+    Args:
+        working_dir (path): path of the folder holding the database
+        list_exp_id (list of str): experiments to be loaded (default: None, all the stored experiments)
+        grid (array): voltage grid (default: 201 points between 0 and 1 if normalize is not None, between 0 and
+            the largest Voc of the selection otherwise)
+        sweep (str): IV0, IV1 or IV2 (default: IV0)
+        normalize (str): None for a grid in Volt, 'voc' for a grid in V/Voc units where Voc is the open
+            circuit voltage of each curve, 'module' for a grid in V/Voc units where Voc is the mean open
+            circuit voltage of the curves of the same module type (default: None)
+
+    Returns:
+        (dataframe): currents with index the exp_id and columns the grid values.
+    '''
+
+    # 3rd party imports
+    import numpy as np
+    import pandas as pd
+
+    #Internal imports
+    from .PVcharacterization_ivcurve import (compute_iv_features,
+                                             pack_iv_curves,
+                                             resample_iv_curves,)
+
+    DATA_BASE_TABLE_FILE = GLOBAL['DATA_BASE_TABLE_FILE']
+
+    if normalize not in (None, 'voc', 'module'):
+        raise Exception("Sorry, normalize must be None, 'voc' or 'module'")
+
+    curves = load_iv_curves(working_dir, list_exp_id, sweep=sweep)
+    if not curves.exp_id:
+        return pd.DataFrame(columns=grid)
+    voltage, current = pack_iv_curves(curves.voltage, curves.current)
+    voc = compute_iv_features(voltage, current)['Voc'].to_numpy()
+
+    voltage_scale = None
+    if normalize == 'voc':
+        voltage_scale = voc
+    elif normalize == 'module':
+        conn = _connect(_database_path(working_dir))
+        dict_module = dict(conn.execute(f"SELECT exp_id, module_type FROM {DATA_BASE_TABLE_FILE}").fetchall())
+        conn.close()
+        modules = pd.Series([dict_module.get(exp_id) for exp_id in curves.exp_id])
+        voltage_scale = pd.Series(voc).groupby(modules).transform('mean').to_numpy()
+
+    if grid is None:
+        grid = np.linspace(0, 1 if normalize is not None else np.nanmax(voc), 201)
+
+    df_curves = pd.DataFrame(resample_iv_curves(voltage, current, grid, voltage_scale=voltage_scale),
+                             index=pd.Index(curves.exp_id, name='exp_id'),
+                             columns=grid)
+
+    return df_curves
@@ -1,49 +1,490 @@
 __all__ = [
     "add_files_to_database",
+    "benchmark_df2sqlite",
+    "build_tag_index",
+    "catalog_irradiances",
+    "catalog_module_types",
+    "catalog_treatments",
+    "check_completeness",
     "df2sqlite",
+    "dump_sql_profile",
+    "export_table",
+    "ingestion_lock",
+    "search_tag",
     "sieve_files",
+    "sql_profiler_report",
+    "start_sql_profiler",
+    "stop_sql_profiler",
     "suppress_duplicate_database",
     "sqlite_to_dataframe",]
-   
+
+# Standard library imports
+import contextlib
+import functools
+import sqlite3
+import threading
+
 from .config import GLOBAL                                    
 
+_SQL_PROFILE = None # Session of the SQL profiler (None when the profiler is off)
 
-def add_files_to_database(files, working_dir):
+_LOCKS_GUARD = threading.Lock() # Guards the per lock file dicts below
+_THREAD_LOCKS = {}              # {lock file path: threading.RLock}
+_LOCKS_DEPTH = {}               # {lock file path: reentrance depth of the file lock}
+
+class _ProfiledCursor(sqlite3.Cursor):
+
+    '''Cursor recording the statement, the number of rows, the wall time and the call site
+    of every execution in the SQL profiler session. The rows are counted whether they are
+    fetched (fetchone, fetchmany, fetchall) or read by iterating the cursor.
+    '''
+    
+    def _record(self, sql, func, *args):
+    
+        # Standard library imports
+        import time
+        
+        record = {'statement': ' '.join(sql.split()),
+                  'rows': 0,
+                  'wall_time': 0.0,
+                  'call_site': _call_site(),}
+        self.connection._in_execute = True
+        t_start = time.perf_counter()
+        try:
+            result = func(sql, *args)
+        finally:
+            record['wall_time'] = time.perf_counter() - t_start
+            self.connection._in_execute = False
+            if self.rowcount > 0: record['rows'] = self.rowcount # INSERT, UPDATE, DELETE statements
+            if _SQL_PROFILE is not None: _SQL_PROFILE['records'].append(record)
+        self._profile_record = record
+        return result
+        
+    def _fetch(self, func, *args):
+    
+        # Standard library imports
+        import time
+        
+        t_start = time.perf_counter()
+        rows = func(*args)
+        record = getattr(self, '_profile_record', None)
+        if record is not None:
+            record['wall_time'] += time.perf_counter() - t_start
+            if isinstance(rows, list):
+                record['rows'] += len(rows)
+            elif rows is not None:
+                record['rows'] += 1
+        return rows
+
+    def execute(self, sql, parameters=()):
+        return self._record(sql, super().execute, parameters)
+        
+    def executemany(self, sql, seq_of_parameters):
+        return self._record(sql, super().executemany, seq_of_parameters)
+        
+    def fetchone(self):
+        return self._fetch(super().fetchone)
+        
+    def fetchmany(self, *args):
+        return self._fetch(super().fetchmany, *args)
+        
+    def fetchall(self):
+        return self._fetch(super().fetchall)
+        
+    def __next__(self): # Rows read by iterating the cursor
+        return self._fetch(super().__next__)
+        
+class _ProfiledConnection(sqlite3.Connection):
+
+    '''Connection creating _ProfiledCursor cursors. The statements run by SQLite outside
+    of a cursor execution (for instance the implicit COMMIT) are recorded through the
+    sqlite3 trace callback.
+    '''
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._in_execute = False
+        self.set_trace_callback(self._trace)
+        
+    def _trace(self, statement):
+        if not self._in_execute and _SQL_PROFILE is not None:
+            _SQL_PROFILE['records'].append({'statement': ' '.join(statement.split()),
+                                            'rows': 0,
+                                            'wall_time': 0.0,
+                                            'call_site': _call_site(),})
+        
+    def cursor(self, factory=_ProfiledCursor):
+        return super().cursor(factory)
+        
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+        
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+        
+def _call_site():
+
+    '''Returns the first frame, out of this module, contextlib and the pandas and sqlite3 packages,
+    as the string "file:line (function)".
+    '''
+    
+    # Standard library imports
+    import os
+    import sys
+    
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if (filename != __file__ and 
+            f'{os.sep}pandas{os.sep}' not in filename and
+            f'{os.sep}sqlite3{os.sep}' not in filename and
+            not filename.endswith('contextlib.py')):
+            return f'{filename}:{frame.f_lineno} ({frame.f_code.co_name})'
+        frame = frame.f_back
+        
+    return ''
+    
+def _database_path(working_dir):
+
+    '''Returns the full path of the database of working_dir. If working_dir is a dict 
+    {site: working_dir} (federated read mode) the dict {site: database full path} is returned.
+    '''
+    
+    # Standard library imports
+    from pathlib import Path
+    
+    DATA_BASE_NAME = GLOBAL['DATA_BASE_NAME']
+    
+    if isinstance(working_dir, dict):
+        return {site: Path(wd) / Path(DATA_BASE_NAME) for site, wd in working_dir.items()}
+        
+    return Path(working_dir) / Path(DATA_BASE_NAME)
+    
+def _connect(database_path, uri=False):
+
+    '''Opens a connection to the database. All the connections of the package are opened
+    by this function so that they are instrumented when the SQL profiler is on.
+    If database_path is a dict {site: database full path} a federated connection is opened
+    (see _connect_federation).
     
+    Args:
+        database_path (path or dict): full path of the database
+        uri (bool): if True the file: URIs are interpreted, in the path and in the ATTACH
+                    statements (default: False)
+        
+    Returns:
+        (sqlite3.Connection): the connection.
     '''
+    
+    if isinstance(database_path, dict):
+        return _connect_federation(database_path)
+    
+    if _SQL_PROFILE is None:
+        return sqlite3.connect(database_path, uri=uri)
+    
+    return sqlite3.connect(database_path, uri=uri, factory=_ProfiledConnection)
+    
+def _connect_federation(dict_database_path):
+
+    '''Opens an in-memory connection which ATTACHes the databases of several sites and 
+    exposes the temporary views DATA_BASE_TABLE_FILE, DATA_BASE_TABLE_EXP and DATA_BASE_TABLE_DIFF
+    as the UNION ALL of the site tables with an additional leading column site.
+    Only the tables existing in every site are exposed, with the columns common to all the sites.
+    The federated connection is read only: the site databases are ATTACHed in mode=ro.
+    
     Args:
-       files (list): list of the full path of the experiece file to be added to the databe
-       working_dir (path): path of the folder holding the database
+        dict_database_path (dict): {site: database full path}
+        
+    Returns:
+        (sqlite3.Connection): the connection.
     '''
     
     # Standard library imports
-    import sqlite3
     from pathlib import Path
-    from string import Template
+    
+    conn = _connect(":memory:", uri=True)
+    sites = list(dict_database_path.keys())
+    for idx, site in enumerate(sites):
+        database_uri = Path(dict_database_path[site]).resolve().as_uri() + '?mode=ro'
+        conn.execute(f"ATTACH DATABASE ? AS site{idx}", (database_uri,))
+        
+    for tbl_name in (GLOBAL['DATA_BASE_TABLE_FILE'],
+                     GLOBAL['DATA_BASE_TABLE_EXP'],
+                     GLOBAL['DATA_BASE_TABLE_DIFF']):
+        list_cols = [[x[1] for x in conn.execute(f"PRAGMA site{idx}.table_info({tbl_name})").fetchall()]
+                     for idx in range(len(sites))]
+        common_cols = [col for col in list_cols[0] if all(col in cols for cols in list_cols[1:])]
+        if not common_cols: continue # The table is missing in at least one site
+        
+        col_str = ','.join(f'"{col}"' for col in common_cols)
+        select_str = ' UNION ALL '.join(f"""SELECT '{site.replace("'", "''")}' AS site, {col_str} FROM site{idx}.{tbl_name}"""
+                                        for idx, site in enumerate(sites))
+        conn.execute(f"CREATE TEMP VIEW {tbl_name} AS {select_str}")
+        
+    return conn
+    
+def start_sql_profiler():
+
+    '''Starts a SQL profiler session. Every connection opened afterwards by the package
+    records the statement text, the number of rows, the wall time and the call site of
+    each statement until stop_sql_profiler is called.
+    '''
+    
+    # Standard library imports
+    import datetime
+    
+    global _SQL_PROFILE
+    
+    _SQL_PROFILE = {'start': datetime.datetime.now().isoformat(timespec='seconds'),
+                    'records': [],}
+    
+def stop_sql_profiler():
+
+    '''Stops the SQL profiler session.
+    
+    Returns:
+        (dict): the session {'start': start date, 'stop': stop date, 'records': list of records}.
+    '''
+    
+    # Standard library imports
+    import datetime
+    
+    global _SQL_PROFILE
+    
+    session = _SQL_PROFILE
+    _SQL_PROFILE = None
+    if session is not None:
+        session['stop'] = datetime.datetime.now().isoformat(timespec='seconds')
+        
+    return session
+    
+def sql_profiler_report(session=None, top=20):
+
+    '''Aggregates the records of a SQL profiler session by statement and call site.
+    
+    Args:
+        session (dict): session returned by stop_sql_profiler (default: the running session)
+        top (int): number of rows of the report, sorted by decreasing total time (default: 20)
+        
+    Returns:
+        (dataframe): columns statement, call_site, calls, rows, total_time, mean_time (in s).
+    '''
+    
+    # 3rd party imports
+    import pandas as pd
+    
+    if session is None: session = _SQL_PROFILE
+    if session is None:
+        raise Exception("Sorry, no SQL profiler session. Use start_sql_profiler first")
+        
+    df = pd.DataFrame(session['records'], columns=['statement', 'rows', 'wall_time', 'call_site'])
+    df_report = df.groupby(['statement', 'call_site'], as_index=False).agg(calls=('wall_time', 'size'),
+                                                                          rows=('rows', 'sum'),
+                                                                          total_time=('wall_time', 'sum'),
+                                                                          mean_time=('wall_time', 'mean'))
+    df_report = df_report.sort_values('total_time', ascending=False).head(top)
+    
+    return df_report.reset_index(drop=True)
+    
+def dump_sql_profile(file, session=None):
+
+    '''Dumps the records of a SQL profiler session in a .json file.
+    
+    Args:
+        file (path): full path of the .json file
+        session (dict): session returned by stop_sql_profiler (default: the running session)
+    '''
+    
+    # Standard library imports
+    import json
+    
+    if session is None: session = _SQL_PROFILE
+    if session is None:
+        raise Exception("Sorry, no SQL profiler session. Use start_sql_profiler first")
+        
+    with open(file, 'w') as f:
+        json.dump(session, f, indent=1)
+        
+
+def add_files_to_database(files, working_dir):
+    
+    '''Adds the description of the files to the table DATA_BASE_TABLE_FILE. The files which
+    exp_id is already in the table (or which name is not a flash test format) are skipped.
+    The insertion, and the one of the new tags in the table DATA_BASE_TABLE_TAG (see build_tag_index),
+    are done in a single transaction under the ingestion lock of working_dir.
+    
+    Args:
+       files (list): list of the full path of the experiece file to be added to the databe
+       working_dir (path): path of the folder holding the database
+       
+    Returns:
+       (list): list of the full path of the files actually added.
+    '''
     
     # Local imports
     from .PVcharacterization_flashtest import parse_filename 
     
-    DATA_BASE_NAME = GLOBAL['DATA_BASE_NAME']
     DATA_BASE_TABLE_FILE = GLOBAL['DATA_BASE_TABLE_FILE']
-
-    database_path = Path(working_dir) / Path(DATA_BASE_NAME)
-    conn = sqlite3.connect(database_path)
-    cursor = conn.cursor()
-    cursor = conn.execute(f'select * from {DATA_BASE_TABLE_FILE} limit 1')
-    col_name = ','.join([i[0] for i in cursor.description])
-    template = Template('INSERT INTO $table($col_names) VALUES($values)')
+    DATA_BASE_TABLE_TAG = GLOBAL['DATA_BASE_TABLE_TAG']
     
+    dict_files_info = {} # Keeps the first file of each exp_id
     for file in files:
         parse = parse_filename(file)
-        value = f"'{parse.exp_id}',{parse.irradiance},'{parse.treatment}','{parse.module_type}','{parse.file_full_path}'"
-        cursor.execute(template.substitute({'table': DATA_BASE_TABLE_FILE,
-                                            'col_names':col_name,
-                                            'values':value}))
+        if parse.status: dict_files_info.setdefault(parse.exp_id, parse)
 
-    conn.commit()
+    with ingestion_lock(working_dir):
+        conn = _connect(_database_path(working_dir))
+        with conn: # Single transaction
+            conn.execute(f"""CREATE TABLE IF NOT EXISTS {DATA_BASE_TABLE_FILE}
+                             (exp_id TEXT, irradiance INTEGER, treatment TEXT, module_type TEXT, file_full_path TEXT)""")
+            known_exp_id = {x[0] for x in conn.execute(f"SELECT exp_id FROM {DATA_BASE_TABLE_FILE}")}
+            list_files_info = [x for exp_id, x in dict_files_info.items() if exp_id not in known_exp_id]
+            conn.executemany(f"""INSERT INTO {DATA_BASE_TABLE_FILE}
+                                 (exp_id, irradiance, treatment, module_type, file_full_path)
+                                 VALUES (?,?,?,?,?)""",
+                             [(x.exp_id, x.irradiance, x.treatment, x.module_type, str(x.file_full_path))
+                              for x in list_files_info])
+            tag_exists = conn.execute("SELECT name FROM sqlite_master WHERE name=?",
+                                      (DATA_BASE_TABLE_TAG,)).fetchone()
+            if tag_exists is not None:
+                conn.executemany(f"INSERT INTO {DATA_BASE_TABLE_TAG} (exp_id, module_type) VALUES (?,?)",
+                                 [(x.exp_id, x.module_type) for x in list_files_info])
+        # Covering index of the catalog SELECT DISTINCT (no-op if it exists)
+        _create_indexes(conn, DATA_BASE_TABLE_FILE, ['exp_id', ('module_type','irradiance','treatment')])
+        conn.close()
+        if tag_exists is None:
+            build_tag_index(working_dir)
+
+    return [x.file_full_path for x in list_files_info]
+    
+@contextlib.contextmanager
+def ingestion_lock(working_dir, timeout=None):
+
+    '''Context manager holding an advisory lock on the database of working_dir across processes
+    (lock file DATA_BASE_NAME.lock in working_dir). The writes to the database are serialized
+    under this lock while the files parsing of concurrent ingesters can run in parallel.
+    The lock is reentrant within a thread.
+    
+    Args:
+        working_dir (path): path of the folder holding the database
+        timeout (float): maximum waiting time in s, None to wait indefinitely (default: None)
+        
+    Example:
+        with ingestion_lock(working_dir):
+            ... writes to the database ...
+    '''
+    
+    # Standard library imports
+    import os
+    import time
+    from pathlib import Path
+    
+    lock_path = str(Path(working_dir) / Path(GLOBAL['DATA_BASE_NAME'] + '.lock'))
+    
+    with _LOCKS_GUARD:
+        thread_lock = _THREAD_LOCKS.setdefault(lock_path, threading.RLock())
+    if not thread_lock.acquire(timeout=-1 if timeout is None else timeout):
+        raise TimeoutError(f"Sorry, the database of {working_dir} is locked by another ingestion")
+        
+    try:
+        if _LOCKS_DEPTH.get(lock_path, 0) > 0: # Reentrant call: the file lock is already held
+            _LOCKS_DEPTH[lock_path] += 1
+            try:
+                yield
+            finally:
+                _LOCKS_DEPTH[lock_path] -= 1
+            return
+            
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT)
+        t_start = time.monotonic()
+        while True:
+            try:
+                _lock_file(fd)
+                break
+            except OSError:
+                if timeout is not None and time.monotonic() - t_start > timeout:
+                    os.close(fd)
+                    raise TimeoutError(f"Sorry, the database of {working_dir} is locked by another ingestion")
+                time.sleep(0.1)
+                
+        _LOCKS_DEPTH[lock_path] = 1
+        try:
+            yield
+        finally:
+            _LOCKS_DEPTH[lock_path] = 0
+            _unlock_file(fd)
+            os.close(fd)
+    finally:
+        thread_lock.release()
+        
+def _lock_file(fd):
+
+    '''Non blocking exclusive lock of the file descriptor fd. Raises OSError if the lock is held.
+    '''
+    
+    # Standard library imports
+    import os
+    
+    if os.name == 'nt':
+        import msvcrt
+        msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        
+def _unlock_file(fd):
+
+    # Standard library imports
+    import os
+    
+    if os.name == 'nt':
+        import msvcrt
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+def _append_dataframe(conn, dataframe, tbl_name):
+
+    '''Appends the rows of dataframe to the table tbl_name. The columns of dataframe missing
+    in the table are added beforehand. The caller is in charge of the transaction.
+    '''
+    
+    table_cols = [x[1] for x in conn.execute(f"PRAGMA table_info({tbl_name})").fetchall()]
+    if table_cols:
+        for col in dataframe.columns:
+            if col not in table_cols:
+                conn.execute(f'ALTER TABLE {tbl_name} ADD COLUMN "{col}"')
+                
+    dataframe.to_sql(tbl_name, conn, if_exists='append', index=False)
+    
+def _table_exists(working_dir, tbl_name):
+
+    '''Returns True if the table tbl_name exists in the database of working_dir.
+    '''
+    
+    conn = _connect(_database_path(working_dir))
+    table = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?",
+                         (tbl_name,)).fetchone()
     conn.close()
     
+    return table is not None
+    
+def _update_columns(conn, dataframe, tbl_name, key='exp_id'):
+
+    '''Sets the values of the columns of dataframe, other than key, in the rows of the table tbl_name
+    matching dataframe[key]. The columns missing in the table are added beforehand.
+    The caller is in charge of the transaction.
+    '''
+    
+    cols = [col for col in dataframe.columns if col != key]
+    _append_dataframe(conn, dataframe.iloc[0:0], tbl_name)  # Adds the missing columns
+    
+    assignments = ', '.join([f'"{col}"=?' for col in cols])
+    conn.executemany(f'UPDATE {tbl_name} SET {assignments} WHERE "{key}"=?',
+                     zip(*[dataframe[col].tolist() for col in cols + [key]]))
+    
 def suppress_duplicate_database(working_dir):
     
     '''Suppresses duplicates from the database.
@@ -53,7 +494,6 @@ def suppress_duplicate_database(working_dir):
     '''
     
     # Standard library imports
-    import sqlite3
     from pathlib import Path
     from string import Template
     
@@ -61,7 +501,7 @@ def suppress_duplicate_database(working_dir):
     DATA_BASE_TABLE_FILE = GLOBAL['DATA_BASE_TABLE_FILE']    
     
     database_path = Path(working_dir) / Path(DATA_BASE_NAME)
-    conn = sqlite3.connect(database_path)
+    conn = _connect(database_path)
 
     cursor = conn.cursor()
 
@@ -84,7 +524,8 @@ def sqlite_to_dataframe(working_dir,tbl_name):
     '''Read a database as a dataframe.
     
     Args:
-        working_dir (path): path of the folder holding the database
+        working_dir (path or dict): path of the folder holding the database or dict {site: path of the folder}
+                                    for a federated read of several databases (see _connect_federation)
         tbl_name (str): name of the table
         
     Returns:
@@ -93,55 +534,161 @@ def sqlite_to_dataframe(working_dir,tbl_name):
     
     # Standard library imports
     from pathlib import Path
-    import sqlite3
     import pandas as pd
     
-    DATA_BASE_NAME = GLOBAL['DATA_BASE_NAME']
-    
-    database_path = Path(working_dir) / Path(DATA_BASE_NAME)
+    database_path = _database_path(working_dir)
 
-    cnx = sqlite3.connect(database_path)
+    cnx = _connect(database_path)
 
     df = pd.read_sql_query("SELECT * FROM "+tbl_name, cnx)
     
     return df
 
-def df2sqlite(dataframe, path_db=None, tbl_name="import"):
+def df2sqlite(dataframe, path_db=None, tbl_name="import", bulk=False, chunksize=50000, index_cols=None):
 
     '''The function df2sqlite converts a dataframe into a squlite database.
     
+    In bulk mode the table is loaded by chunks of parameterized inserts inside a single transaction,
+    with a large cache_size, the WAL journal and synchronous=NORMAL, which cannot corrupt the database
+    on a crash (see _bulk_load). The indexes are built after the load.
+    
     Args:
        dataframe (panda.DataFrame): the dataframe to convert in a data base
        path_db (Path): full pathname of the database
        tbl_name (str): name of the table
+       bulk (bool): if True use the bulk-load mode (default: False)
+       chunksize (int): number of rows inserted per executemany call in bulk mode (default: 50000)
+       index_cols (list of str or list of tuples): columns to be indexed after the load (default: None)
     '''
     
-    # Standard library imports
-    import sqlite3
+    if path_db is None:  # Connetion to the database
+        conn = _connect(":memory:")
+    else:
+        conn = _connect(path_db)
+        
+    if bulk:
+        _bulk_load(conn, dataframe, tbl_name, chunksize)
+    else:
+        # Creates a database and a table
+        cur = conn.cursor()
+        col_str = '"' + '","'.join(dataframe.columns) + '"'
+        cur.execute(f"CREATE TABLE IF NOT EXISTS {tbl_name} ({col_str})")
+        dataframe.to_sql(tbl_name, conn, if_exists='replace', index = False)
+        cur.close()
+        
+    if index_cols is not None:
+        _create_indexes(conn, tbl_name, index_cols)
+
+    conn.close()
+    
+def _bulk_load(conn, dataframe, tbl_name, chunksize):
+
+    '''Replaces the table tbl_name by the content of dataframe using chunked executemany inserts in a 
+    single transaction, a large cache, the WAL journal and synchronous=NORMAL. The cache size and the 
+    synchronous mode are connection settings dropped when the caller closes conn; the journal mode,
+    persistent in the database file, is restored at the end so that the database stays readable on 
+    read-only media and network shares.
+    '''
     
     # 3rd party imports
     import pandas as pd
+    
+    saved_journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-200000") # Negative value: size in KiB
+    
+    def sql_type(dtype):
+        if pd.api.types.is_integer_dtype(dtype) or pd.api.types.is_bool_dtype(dtype): return 'INTEGER'
+        if pd.api.types.is_float_dtype(dtype): return 'REAL'
+        if pd.api.types.is_datetime64_any_dtype(dtype): return 'TIMESTAMP'
+        return 'TEXT'
+    
+    df = dataframe.copy(deep=False)
+    for col in df.columns: # sqlite3 cannot bind Timestamps
+        if pd.api.types.is_datetime64_any_dtype(df[col].dtype):
+            df[col] = df[col].dt.strftime('%Y-%m-%d %H:%M:%S')
+    
+    col_str = ','.join([f'"{col}" {sql_type(dtype)}' for col,dtype in dataframe.dtypes.items()])
+    placeholders = ','.join(['?'] * len(df.columns))
+    
+    try:
+        conn.execute("BEGIN")
+        conn.execute(f"DROP TABLE IF EXISTS {tbl_name}")
+        conn.execute(f"CREATE TABLE {tbl_name} ({col_str})")
+        for idx in range(0, len(df), chunksize):
+            chunk = df.iloc[idx:idx+chunksize]
+            rows = zip(*[chunk[col].tolist() for col in chunk.columns]) # tolist yields python scalars
+            conn.executemany(f"INSERT INTO {tbl_name} VALUES ({placeholders})", rows)
+        conn.commit()
+    except:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute(f"PRAGMA journal_mode={saved_journal_mode}")
+            
+def _create_indexes(conn, tbl_name, index_cols):
 
-    if path_db is None:  # Connetion to the database
-        conn = sqlite3.connect(":memory:")
-    else:
-        conn = sqlite3.connect(path_db)
+    '''Creates the indexes of the table tbl_name. index_cols is a list of column names
+    or of tuples of column names for multi-column indexes.
+    '''
+    
+    for cols in index_cols:
+        if isinstance(cols, str): cols = (cols,)
+        idx_name = f"idx_{tbl_name}_" + "_".join(col.replace(' ', '_') for col in cols)
+        col_str = ','.join(f'"{col}"' for col in cols)
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {idx_name} ON {tbl_name} ({col_str})")
+    conn.commit()
+    
+def benchmark_df2sqlite(nbr_rows=100000, path_db=None):
+
+    '''Measures the loading rate (rows/s) of df2sqlite in default and in bulk mode
+    using a synthetic dataframe shaped as the table DATA_BASE_TABLE_EXP.
+    
+    Args:
+        nbr_rows (int): number of rows of the synthetic dataframe (default: 100000)
+        path_db (path): full path of the scratch database (default: temporary file)
         
-    # Creates a database and a table
-    cur = conn.cursor()
-    col_str = '"' + '","'.join(dataframe.columns) + '"'
-    cur.execute(f"CREATE TABLE IF NOT EXISTS {tbl_name} ({col_str})")
-    dataframe.to_sql(tbl_name, conn, if_exists='replace', index = False)
-
-    #cols_type = ",".join(["?"] * len(dataframe.columns))
-    #data = [tuple(x) for x in dataframe.values]
-    #cur.execute(f"DROP TABLE IF EXISTS {tbl_name}")
-    #col_str = '"' + '","'.join(dataframe.columns) + '"'
-    #cur.execute(f"CREATE TABLE {tbl_name} ({col_str})")
-    #cur.executemany(f"insert into {tbl_name} values ({cols_type})", data)
-    #conn.commit()
-    cur.close()
-    conn.close()
+    Returns:
+        (dict): {'default': rows/s, 'bulk': rows/s}
+    '''
+    
+    # Standard library imports
+    import os
+    import tempfile
+    import time
+    from pathlib import Path
+    
+    # 3rd party imports
+    import numpy as np
+    import pandas as pd
+    
+    COL_NAMES = GLOBAL['COL_NAMES']
+    
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(rng.random((nbr_rows, len(COL_NAMES))), columns=COL_NAMES)
+    df['Title'] = 'HET JNHM72 6x12 M2 0200W'
+    df['irradiance'] = rng.choice(GLOBAL['IRRADIANCE_DEFAULT_LIST'], nbr_rows)
+    df['treatment'] = rng.choice(GLOBAL['TREATMENT_DEFAULT_LIST'], nbr_rows)
+    df['module_type'] = [f'MODULE{x}' for x in rng.integers(0, 1000, nbr_rows)]
+    df.insert(0, 'exp_id', [f'{x}_{y}W_{z}' for x,y,z in zip(df['module_type'], df['irradiance'], df['treatment'])])
+    
+    tmp_dir = None
+    if path_db is None:
+        tmp_dir = tempfile.TemporaryDirectory()
+        path_db = Path(tmp_dir.name) / Path('benchmark.db')
+    
+    rates = {}
+    for mode in ('default', 'bulk'):
+        if os.path.exists(path_db): os.remove(path_db)
+        t_start = time.perf_counter()
+        df2sqlite(df, path_db=path_db, tbl_name='benchmark', bulk=(mode == 'bulk'),
+                  index_cols=[('module_type', 'irradiance', 'treatment')])
+        rates[mode] = nbr_rows / (time.perf_counter() - t_start)
+        
+    if tmp_dir is not None: tmp_dir.cleanup()
+    
+    return rates
     
 def sieve_files(irradiance_select, treatment_select, module_type_select, database_path):
 
@@ -154,44 +701,396 @@ def sieve_files(irradiance_select, treatment_select, module_type_select, databas
            irradiance_select (list of int): list of irradiances to be selected
            treatment_select (list of str): list of treatments to be selected
            module_type_select (list of str): list of modules to be selected
-           database_path (path): full path of the data base
+           database_path (path or dict): full path of the data base or dict {site: full path of the data base}
+                                         for a federated read of several data bases
            
         Return:
           List of the full path of the selected files.
     '''
     # Standard library imports
-    import sqlite3
     from string import Template
     
     DATA_BASE_TABLE_FILE = GLOBAL['DATA_BASE_TABLE_FILE']
 
-    conv2str = lambda list_: str(tuple(list_)).replace(",)", ")")
-
-    conn = sqlite3.connect(database_path)
+    conn = _connect(database_path)
     cur = conn.cursor()
+    
+    # The selections are loaded in indexed temporary tables joined with the files table
+    # so that the querry and its plan do not depend on the selections sizes
+    selections = {'module_type': [str(x) for x in module_type_select],
+                  'irradiance': [int(x) for x in irradiance_select],
+                  'treatment': [str(x) for x in treatment_select],}
+    for field, values in selections.items():
+        cur.execute(f"CREATE TEMP TABLE select_{field} (value PRIMARY KEY) WITHOUT ROWID")
+        cur.executemany(f"INSERT OR IGNORE INTO temp.select_{field} VALUES (?)",
+                        [(value,) for value in values])
 
     querry_d = Template(
         """SELECT file_full_path
                         FROM $table_name 
-                        WHERE module_type  IN $module_type_select
-                        AND irradiance IN $irradiance_select
-                        AND treatment IN $treatment_select
+                        JOIN temp.select_module_type ON module_type = temp.select_module_type.value
+                        JOIN temp.select_irradiance ON irradiance = temp.select_irradiance.value
+                        JOIN temp.select_treatment ON treatment = temp.select_treatment.value
                         ORDER BY module_type ASC
                         """
     )
 
-    cur.execute(
-        querry_d.substitute(
-            {
-                "table_name": DATA_BASE_TABLE_FILE,
-                "module_type_select": conv2str(module_type_select),
-                "irradiance_select": conv2str(irradiance_select),
-                "treatment_select": conv2str(treatment_select),
-            }
-        )
-    )
+    cur.execute(querry_d.substitute({"table_name": DATA_BASE_TABLE_FILE}))
 
     querry = [x[0] for x in cur.fetchall()]
     cur.close()
     conn.close()
     return querry
+
+def build_tag_index(working_dir):
+
+    '''Builds the table DATA_BASE_TABLE_TAG indexing the fields exp_id and module_type of
+    the table DATA_BASE_TABLE_FILE for substring searches. The index is a SQLite FTS5 table
+    using the trigram tokenizer. If FTS5 trigram is not available (SQLite < 3.34) a plain
+    table is built and the searches fall back to a scan of this table.
+    The index is built under the ingestion lock of working_dir. It is kept up to date by 
+    add_files_to_database.
+    
+    Args:
+        working_dir (path): path of the folder holding the database
+    '''
+    
+    # Standard library imports
+    import sqlite3
+    from pathlib import Path
+    
+    DATA_BASE_NAME = GLOBAL['DATA_BASE_NAME']
+    DATA_BASE_TABLE_FILE = GLOBAL['DATA_BASE_TABLE_FILE']
+    DATA_BASE_TABLE_TAG = GLOBAL['DATA_BASE_TABLE_TAG']
+    
+    database_path = Path(working_dir) / Path(DATA_BASE_NAME)
+    with ingestion_lock(working_dir):
+        conn = _connect(database_path)
+        cur = conn.cursor()
+        
+        cur.execute(f"DROP TABLE IF EXISTS {DATA_BASE_TABLE_TAG}")
+        try:
+            cur.execute(f"""CREATE VIRTUAL TABLE {DATA_BASE_TABLE_TAG}
+                            USING fts5(exp_id, module_type, tokenize='trigram case_sensitive 1')""")
+        except sqlite3.OperationalError: # FTS5 or trigram tokenizer not available
+            cur.execute(f"CREATE TABLE {DATA_BASE_TABLE_TAG} (exp_id, module_type)")
+            
+        cur.execute(f"""INSERT INTO {DATA_BASE_TABLE_TAG} (exp_id, module_type)
+                        SELECT exp_id, module_type FROM {DATA_BASE_TABLE_FILE}""")
+        conn.commit()
+        cur.close()
+        conn.close()
+    
+def search_tag(tag, working_dir, field='module_type'):
+
+    '''Substring search of tag in the field exp_id or module_type of the database.
+    The search is case sensitive and equivalent to df[field].str.contains(tag, regex=False).
+    It uses the trigram index built by build_tag_index. Tags shorter than three characters cannot 
+    be resolved by the trigram index and are searched by a scan of the index table. The search only
+    reads the database: if the index is missing the table DATA_BASE_TABLE_FILE is scanned instead.
+    
+    Args:
+        tag (str): substring to search (ex: '731', 'BOREALIS')
+        working_dir (path or dict): path of the folder holding the database or dict {site: path of the folder}
+        field (str): 'module_type' or 'exp_id' (default: 'module_type')
+        
+    Returns:
+        (list of str): sorted list of the distinct values of field containing tag.
+        
+    Example:
+        list_mod = search_tag('BOREALIS', working_dir)
+        df_meta = df_meta.query('module_type in @list_mod')
+    '''
+    
+    DATA_BASE_TABLE_FILE = GLOBAL['DATA_BASE_TABLE_FILE']
+    DATA_BASE_TABLE_TAG = GLOBAL['DATA_BASE_TABLE_TAG']
+    
+    if field not in ('module_type', 'exp_id'):
+        raise Exception(f"Sorry, the field must be 'module_type' or 'exp_id' not {field}")
+    
+    database_path = _database_path(working_dir)
+    conn = _connect(database_path)
+    cur = conn.cursor()
+    
+    tbl_sql = None
+    if not isinstance(working_dir, dict): # The federated reads scan the files table of the sites
+        cur.execute("SELECT sql FROM sqlite_master WHERE name=?", (DATA_BASE_TABLE_TAG,))
+        tbl_sql = cur.fetchone()
+    
+    if tbl_sql is None: # No index: scan of the files table
+        cur.execute(f"""SELECT DISTINCT {field} FROM {DATA_BASE_TABLE_FILE}
+                        WHERE instr({field}, ?) > 0""", (tag,))
+    elif 'fts5' in tbl_sql[0] and len(tag) >= 3:
+        tag_phrase = '"' + tag.replace('"', '""') + '"' # FTS5 string phrase
+        cur.execute(f"""SELECT DISTINCT {field} FROM {DATA_BASE_TABLE_TAG}
+                        WHERE {field} MATCH ?""", (tag_phrase,))
+    else:
+        cur.execute(f"""SELECT DISTINCT {field} FROM {DATA_BASE_TABLE_TAG}
+                        WHERE instr({field}, ?) > 0""", (tag,))
+        
+    list_values = sorted(x[0] for x in cur.fetchall())
+    cur.close()
+    conn.close()
+    
+    return list_values
+
+def export_table(working_dir, file, tbl_name=None, querry=None, params=None, chunksize=10000):
+
+    '''Streams a table (or the result of a querry) of the database to a .csv, .xlsx or
+    Arrow IPC (.arrow, .feather) file. The rows are fetched by chunks of chunksize rows
+    and written as they come so the whole table is never held in memory. The .xlsx file
+    is written with XlsxWriter in constant memory mode.
+    
+    Args:
+        working_dir (path): path of the folder holding the database
+        file (path): full path of the exported file. The format is set by the suffix.
+        tbl_name (str): name of the table to export (default: GLOBAL['DATA_BASE_TABLE_EXP'])
+        querry (str): SELECT statement used instead of tbl_name (default: None)
+        params (tuple): parameters bound to the querry placeholders (default: None)
+        chunksize (int): number of rows fetched per chunk (default: 10000)
+        
+    Returns:
+        (int): number of exported rows.
+    '''
+    
+    # Standard library imports
+    from pathlib import Path
+    
+    # 3rd party imports
+    import pandas as pd
+    
+    
+    file = Path(file)
+    fmt = file.suffix.lower()
+    if fmt not in ('.csv', '.xlsx', '.arrow', '.feather'):
+        raise Exception(f"Sorry, the export format {fmt} is not supported (.csv, .xlsx, .arrow, .feather)")
+    
+    if querry is None:
+        if tbl_name is None: tbl_name = GLOBAL['DATA_BASE_TABLE_EXP']
+        querry = f"SELECT * FROM {tbl_name}"
+    
+    database_path = _database_path(working_dir)
+    conn = _connect(database_path)
+    chunks = pd.read_sql_query(querry, conn, params=params, chunksize=chunksize)
+    
+    nbr_rows = 0
+    if fmt == '.csv':
+        for idx, chunk in enumerate(chunks):
+            chunk.to_csv(file, mode='w' if idx == 0 else 'a', header=(idx == 0), index=False)
+            nbr_rows += len(chunk)
+            
+    elif fmt == '.xlsx':
+        # 3rd party imports
+        import xlsxwriter
+        
+        workbook = xlsxwriter.Workbook(file, {'constant_memory': True, 'nan_inf_to_errors': True})
+        worksheet = workbook.add_worksheet()
+        for chunk in chunks:
+            if nbr_rows == 0:
+                worksheet.write_row(0, 0, chunk.columns)
+            for row in chunk.itertuples(index=False): # Rows must be written in order in constant memory mode
+                nbr_rows += 1
+                worksheet.write_row(nbr_rows, 0, [None if pd.isna(x) else x for x in row])
+        workbook.close()
+        
+    else:
+        # 3rd party imports
+        import pyarrow as pa
+        
+        writer = None
+        for chunk in chunks:
+            if writer is None:
+                schema = _arrow_schema(conn, querry, params, chunk.columns)
+                writer = pa.ipc.new_file(str(file), schema)
+            for field in schema:
+                if pa.types.is_string(field.type): # Mixed storage classes are exported as text
+                    chunk[field.name] = [None if pd.isna(x) else str(x) for x in chunk[field.name]]
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            nbr_rows += len(chunk)
+        if writer is not None: writer.close()
+    
+    conn.close()
+    
+    return nbr_rows
+
+def _arrow_schema(conn, querry, params, columns):
+
+    '''Returns the Arrow schema of the export of the querry. The type of each column is set by the SQLite
+    storage classes of its values in the whole querry result, whatever its declared type (the columns added
+    by _append_dataframe have none): int64 for integer, float64 for real or integer and real, string for
+    text, binary for blob and null if all the values are NULL. The columns mixing other storage classes
+    (e.g. numeric text next to real) are exported as string.
+    '''
+    
+    # 3rd party imports
+    import pyarrow as pa
+    
+    dict_types = {('integer',): pa.int64(),
+                  ('real',): pa.float64(),
+                  ('integer', 'real'): pa.float64(),
+                  ('text',): pa.string(),
+                  ('blob',): pa.binary(),
+                  (): pa.null()}
+    
+    cols = [col.replace('"', '""') for col in columns]
+    storage_classes = conn.execute(f'''SELECT {', '.join([f'group_concat(DISTINCT typeof("{col}"))' for col in cols])}
+                                      FROM ({querry})''', params or ()).fetchone()
+    
+    list_fields = []
+    for col, classes in zip(columns, storage_classes):
+        classes = tuple(sorted(set((classes or '').split(',')) - {'', 'null'}))
+        list_fields.append(pa.field(col, dict_types.get(classes, pa.string())))
+    
+    return pa.schema(list_fields)
+
+def _catalog(working_dir):
+
+    '''Returns the dict {module_type: (set of irradiances, set of treatments)} of the table
+    DATA_BASE_TABLE_FILE. The catalog is cached in-process and refreshed whenever the database
+    file is modified. The lookup is read only: the covering index (module_type, irradiance, treatment)
+    is created where the table is written (build_files_database, add_files_to_database).
+    '''
+    
+    # Standard library imports
+    import os
+    
+    DATA_BASE_TABLE_FILE = GLOBAL['DATA_BASE_TABLE_FILE']
+    
+    database_path = _database_path(working_dir)
+    
+    if isinstance(database_path, dict): # Federated read: the cache key gathers all the sites
+        database_path = tuple((site, str(path)) for site, path in database_path.items())
+        mtime_ns = tuple(os.stat(path).st_mtime_ns for _, path in database_path)
+        return _catalog_cached(database_path, mtime_ns, DATA_BASE_TABLE_FILE)
+    
+    return _catalog_cached(str(database_path), os.stat(database_path).st_mtime_ns, DATA_BASE_TABLE_FILE)
+
+@functools.lru_cache(maxsize=16)
+def _catalog_cached(database_path, mtime_ns, tbl_name):
+
+    '''Builds the catalog out of a single SELECT DISTINCT querry. The argument mtime_ns
+    is only used to invalidate the cache when the database is modified.
+    '''
+    
+    if isinstance(database_path, tuple): database_path = dict(database_path)
+    
+    conn = _connect(database_path)
+    cur = conn.execute(f"SELECT DISTINCT module_type, irradiance, treatment FROM {tbl_name}")
+    catalog = {}
+    for module_type, irradiance, treatment in cur.fetchall():
+        irradiances, treatments = catalog.setdefault(module_type, (set(), set()))
+        irradiances.add(irradiance)
+        treatments.add(treatment)
+    conn.close()
+    
+    return catalog
+    
+def catalog_module_types(working_dir):
+
+    '''Returns the sorted list of the distinct module types of the database.
+    
+    Args:
+        working_dir (path): path of the folder holding the database
+    '''
+    
+    return sorted(_catalog(working_dir).keys())
+    
+def catalog_irradiances(working_dir, list_mod_selected):
+
+    '''Returns the sorted list of the distinct irradiances measured on the modules list_mod_selected.
+    
+    Args:
+        working_dir (path): path of the folder holding the database
+        list_mod_selected (list of str): list of module types
+    '''
+    
+    catalog = _catalog(working_dir)
+    irradiances = set()
+    for module_type in list_mod_selected:
+        irradiances |= catalog.get(module_type, (set(), set()))[0]
+        
+    return sorted(irradiances)
+    
+def catalog_treatments(working_dir, list_mod_selected):
+
+    '''Returns the sorted list of the distinct treatments applied to the modules list_mod_selected.
+    
+    Args:
+        working_dir (path): path of the folder holding the database
+        list_mod_selected (list of str): list of module types
+    '''
+    
+    catalog = _catalog(working_dir)
+    treatments = set()
+    for module_type in list_mod_selected:
+        treatments |= catalog.get(module_type, (set(), set()))[1]
+        
+    return sorted(treatments)
+
+def check_completeness(working_dir, list_irradiance=None, list_treatment=None):
+
+    '''Computes the completeness cube module_type x irradiance x treatment of the table
+    DATA_BASE_TABLE_FILE out of a single grouped querry.
+    If list_irradiance (resp. list_treatment) is None, a module is expected to have been
+    measured at every irradiance (resp. treatment) found for this module in the database
+    (all the (irradiance, treatment) combinations of the module must exist). Otherwise
+    every module is expected to be measured at every irradiance (resp. treatment) of the list.
+    
+    Args:
+        working_dir (path): path of the folder holding the database
+        list_irradiance (list of int): expected irradiances (default: None)
+        list_treatment (list of str): expected treatments (default: None)
+        
+    Returns:
+        (namedtuple): completeness.cube (ndarray of bool of shape (nbr modules, nbr irradiances, nbr treatments))
+                      completeness.module_type, completeness.irradiance, completeness.treatment the axes of the cube
+                      completeness.missing dict {module_type: [(irradiance, treatment),...]} of the
+                      missing combinations (modules without missing combination are omitted)
+    '''
+    
+    # Standard library imports
+    from collections import namedtuple
+    
+    # 3rd party imports
+    import numpy as np
+    
+    DATA_BASE_TABLE_FILE = GLOBAL['DATA_BASE_TABLE_FILE']
+    
+    completeness_struct = namedtuple("completeness",
+                                     ["cube", "module_type", "irradiance", "treatment", "missing"])
+    
+    database_path = _database_path(working_dir)
+    conn = _connect(database_path)
+    rows = conn.execute(f"""SELECT module_type, irradiance, treatment
+                            FROM {DATA_BASE_TABLE_FILE}
+                            GROUP BY module_type, irradiance, treatment""").fetchall()
+    conn.close()
+    
+    module_type = sorted({x[0] for x in rows})
+    irradiance = sorted({x[1] for x in rows} | set(list_irradiance or []))
+    treatment = sorted({x[2] for x in rows} | set(list_treatment or []))
+    
+    idx_mod = {x:i for i,x in enumerate(module_type)}
+    idx_irr = {x:i for i,x in enumerate(irradiance)}
+    idx_trt = {x:i for i,x in enumerate(treatment)}
+    
+    cube = np.zeros((len(module_type), len(irradiance), len(treatment)), dtype=bool)
+    if rows:
+        cube[tuple(np.array([(idx_mod[m], idx_irr[i], idx_trt[t]) for m,i,t in rows]).T)] = True
+    
+    if list_irradiance is None:
+        expected_irr = cube.any(axis=2)                    # (module, irradiance)
+    else:
+        expected_irr = np.isin(irradiance, list_irradiance)[np.newaxis, :].repeat(len(module_type), axis=0)
+    if list_treatment is None:
+        expected_trt = cube.any(axis=1)                    # (module, treatment)
+    else:
+        expected_trt = np.isin(treatment, list_treatment)[np.newaxis, :].repeat(len(module_type), axis=0)
+        
+    expected = expected_irr[:, :, np.newaxis] & expected_trt[:, np.newaxis, :]
+    
+    missing = {}
+    for m, i, t in zip(*np.nonzero(expected & ~cube)):
+        missing.setdefault(module_type[m], []).append((irradiance[i], treatment[t]))
+        
+    return completeness_struct(cube, module_type, irradiance, treatment, missing)
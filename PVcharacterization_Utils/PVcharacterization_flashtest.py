@@ -13,6 +13,7 @@ __all__ = [
     "build_metadata_df_from_db",
     "build_modules_filenames",
     "build_modules_list",
+    "compute_relative_diff",
     "correct_filename",
     "correct_iv_curve",
     "data_dashboard",
@@ -20,21 +21,55 @@ __all__ = [
     "parse_filename",
     "pv_flashtest_pca",
     "read_and_clean",
+    "read_degradation_table",
     "read_flashtest_file",
+    "recompute_corrected_parameters",
     "select_irradiance",
     "select_module",
+    "update_degradation_table",
+    "update_discrepancy_table",
+    "update_iec60891_parameters",
+    "update_iv_steps",
+    "update_single_diode_parameters",
+    "update_slope_resistances",
 ]
 
 #Internal imports 
 from .config import GLOBAL
 from .PVcharacterization_GUI import (select_data_dir,
                                      select_items,)
-from .PVcharacterization_database import (add_files_to_database,
+from .PVcharacterization_database import (_append_dataframe,
+                                          _connect,
+                                          _database_path,
+                                          _table_exists,
+                                          _update_columns,
+                                          add_files_to_database,
+                                          build_tag_index,
+                                          catalog_irradiances,
+                                          catalog_module_types,
+                                          check_completeness,
                                           df2sqlite,
+                                          ingestion_lock,
                                           sieve_files,
                                           sqlite_to_dataframe,
                                           suppress_duplicate_database,
                                            )
+from .PVcharacterization_curvestore import (load_iv_curves,
+                                             update_curve_store,)
+from .PVcharacterization_ivcurve import (CORRECTION_COLS,
+                                         DERIVATION_VERSION,
+                                         REPEATABILITY_COLS,
+                                         STEP_COLS,
+                                         compute_corrected_parameters,
+                                         compute_iv_features,
+                                         compute_qc_flags,
+                                         compute_repeatability,
+                                         compute_slope_resistances,
+                                         correct_iec60891,
+                                         correct_iv_curves,
+                                         detect_iv_steps,
+                                         fit_single_diode,
+                                         pack_iv_curves,)
                                        
 def read_flashtest_file(filepath, parse_all=True,warning=False):
 
@@ -413,8 +448,13 @@ def build_files_database(db_folder,ft_folder,verbose=True):
 
     database_path = Path(db_folder) / Path(DATA_BASE_NAME)
 
-    df2sqlite(df_files_descp.drop('status',axis=1), path_db=database_path, tbl_name=DATA_BASE_TABLE_FILE)
-    suppress_duplicate_database(db_folder)
+    with ingestion_lock(db_folder):
+        df2sqlite(df_files_descp.drop('status',axis=1),
+                  path_db=database_path,
+                  tbl_name=DATA_BASE_TABLE_FILE,
+                  index_cols=['exp_id', ('module_type','irradiance','treatment')])
+        suppress_duplicate_database(db_folder)
+        build_tag_index(db_folder)
     
     if verbose:
         print(f'{len(datafiles_list)} flash test files detected.\n{len(list_multi_file)} duplicates suppressed\nThe database table {DATA_BASE_TABLE_FILE} in {database_path} is built\n\n')
@@ -430,15 +470,14 @@ def build_metadata_dataframe(working_dir,interactive=False):
        interactive (boolean): if True select interactivelly the modules otherwise takes all the modules
     '''
 
-    DATA_BASE_TABLE_FILE = GLOBAL['DATA_BASE_TABLE_FILE']
-    
-    df_files_descp = sqlite_to_dataframe(working_dir, DATA_BASE_TABLE_FILE)
     if interactive:
         # Interactive selection of the modules
-        list_mod_selected = build_modules_list(df_files_descp)                                
+        list_mod_selected = select_items(catalog_module_types(working_dir),
+                                         'Select the modules type',
+                                         mode = 'multiple')
 
     else:
-        list_mod_selected = df_files_descp['module_type'].unique()
+        list_mod_selected = catalog_module_types(working_dir)
         
     # Extraction from the file database all the filenames related to the selected modules
     list_files_path = build_modules_filenames(list_mod_selected,working_dir)
@@ -474,21 +513,30 @@ def _build_metadata_dataframe(list_files_path, working_dir):
     DATA_BASE_NAME = GLOBAL['DATA_BASE_NAME']
     DATA_BASE_TABLE_EXP = GLOBAL['DATA_BASE_TABLE_EXP']
 
-    df_meta = build_df_meta(list_files_path)
+    df_meta = build_df_meta(list_files_path, working_dir=working_dir)
 
     # Builds a database
     database_path = Path(working_dir) / Path(DATA_BASE_NAME)
-    df2sqlite(df_meta, path_db=database_path, tbl_name=DATA_BASE_TABLE_EXP)
+    with ingestion_lock(working_dir):
+        df2sqlite(df_meta,
+                  path_db=database_path,
+                  tbl_name=DATA_BASE_TABLE_EXP,
+                  bulk=True,
+                  index_cols=['exp_id', ('module_type','irradiance','treatment'), 'qc_flags'])
+        update_degradation_table(working_dir)
     
     return df_meta
 
 
-def build_metadata_df_from_db(working_dir,list_mod_selected,list_irradiance):
+def build_metadata_df_from_db(working_dir,list_mod_selected,list_irradiance,exclude_suspect=False):
 
     '''
     Args:
-        working_dir (str): full path of the folder containing the database.
+        working_dir (str or dict): full path of the folder containing the database or dict {site: full path}
+                                   for a federated read of several databases.
         mode (list): if None select interactivelly the list of module types, otherwise takes all the module type.
+        exclude_suspect (bool): if True only the experiments which pass all the quality checks (qc_flags = 0,
+                                see compute_qc_flags) are kept (default: False).
    
     '''
     
@@ -500,7 +548,12 @@ def build_metadata_df_from_db(working_dir,list_mod_selected,list_irradiance):
     
 
     # Extraction from the file database all the filenames related to the selected modules
-    df_meta = sqlite_to_dataframe(working_dir,DATA_BASE_TABLE_EXP)
+    if exclude_suspect:
+        conn = _connect(_database_path(working_dir))
+        df_meta = pd.read_sql_query(f"SELECT * FROM {DATA_BASE_TABLE_EXP} WHERE qc_flags = 0", conn)
+        conn.close()
+    else:
+        df_meta = sqlite_to_dataframe(working_dir,DATA_BASE_TABLE_EXP)
     df_meta = df_meta.query('module_type in @list_mod_selected')
     
     df_meta = df_meta.query('irradiance in @list_irradiance')
@@ -512,12 +565,14 @@ def select_module(working_dir,mode=None):
     
     '''Module selection if mode=None we interactively choose the modules otherwise, we select all the modules
     '''
-    df_files_descp = sqlite_to_dataframe(working_dir,GLOBAL['DATA_BASE_TABLE_FILE'])
+    list_modules_type = catalog_module_types(working_dir)
 
     if mode is None:    
-        list_mod_selected = build_modules_list(df_files_descp)
+        list_mod_selected = select_items(list_modules_type,
+                                         'Select the modules type',
+                                         mode = 'multiple')
     else:
-        list_mod_selected = df_files_descp['module_type'].unique()
+        list_mod_selected = list_modules_type
         
     return list_mod_selected
 
@@ -525,8 +580,7 @@ def select_irradiance(working_dir,list_mod_selected, mode=None):
     
     '''Module selection if mode=None we interactively choose the irradiances otherwise, we select all the irradiances
     '''
-    df_files_descp = sqlite_to_dataframe(working_dir,GLOBAL['DATA_BASE_TABLE_FILE'])
-    list_all_irradiance = df_files_descp.query('module_type in @list_mod_selected').irradiance.unique()
+    list_all_irradiance = catalog_irradiances(working_dir,list_mod_selected)
 
     if mode is None:    
         list_irradiance = list_all_irradiance
@@ -577,12 +631,11 @@ def build_modules_filenames(list_mod_selected,working_dir):
     import os
     from pathlib import Path   
 
-    DATA_BASE_NAME = GLOBAL['DATA_BASE_NAME'] 
     IRRADIANCE_DEFAULT_LIST = GLOBAL['IRRADIANCE_DEFAULT_LIST']  
     TREATMENT_DEFAULT_LIST = GLOBAL['TREATMENT_DEFAULT_LIST']    
     
     # Extract from the file database all the filenames related to the selected modules
-    database_path = Path(working_dir) / Path(DATA_BASE_NAME)
+    database_path = _database_path(working_dir)
     list_files_path = sieve_files(IRRADIANCE_DEFAULT_LIST,
                              TREATMENT_DEFAULT_LIST,
                              list_mod_selected,
@@ -794,15 +847,18 @@ def batch_filename_correction(working_dir, verbose=False):
     status = 'Correction done on :'+ ', '.join(list_mod_selected[1:]) + '\nnew name: ' + new_moduletype_name
     return status 
 
-def correct_iv_curve(voltage,current):
+def correct_iv_curve(voltage,current,settings=None):
     
     '''Correct improper values of the iv curve for low voltage.
-    Method: we fit iv curve between min_voltage_fit (5 V) and max_voltage_fit (20 V)
-    by a polynomial of order 1 and extrapolate its values for voltage > min_voltage_fit.
+    Method: we fit iv curve between min_voltage_fit and max_voltage_fit
+    by a polynomial of order 1 and replace the current by its fitted value for voltage < max_voltage_fit
+    when the relative deviation exceeds error_max (see correct_iv_curves for the batched version).
     
     Args:
        voltage (list): list of voltage of the IV curve.
        current (list): list of current of the IV curve.
+       settings (dict): {'min_voltage_fit': in V, 'max_voltage_fit': in V, 'error_max': in %}
+                        (default: GLOBAL['IV_CORRECTION_DICT'])
        
     Returns:
        (list) corrected current.
@@ -814,12 +870,13 @@ def correct_iv_curve(voltage,current):
     # 3rd party imports
     import numpy as np
 
-    min_voltage_fit = 5   # in Volt
-    max_voltage_fit = 20  # in A
-    error_max = 0.3       # in percent
+    if settings is None: settings = GLOBAL['IV_CORRECTION_DICT']
+    min_voltage_fit = settings['min_voltage_fit']   # in Volt
+    max_voltage_fit = settings['max_voltage_fit']   # in Volt
+    error_max = settings['error_max']               # in percent
     
-    voltage_idx_min = bisect.bisect_left(voltage, 5, lo=0, hi=len(voltage))
-    voltage_idx_max = bisect.bisect_left(voltage, 25, lo=0, hi=len(voltage))
+    voltage_idx_min = bisect.bisect_left(voltage, min_voltage_fit, lo=0, hi=len(voltage))
+    voltage_idx_max = bisect.bisect_left(voltage, max_voltage_fit, lo=0, hi=len(voltage))
     current_fit = current[voltage_idx_min:voltage_idx_max]
     voltage_fit = voltage[voltage_idx_min:voltage_idx_max]
     
@@ -947,49 +1004,81 @@ def fit_curve(x,y,order=2,n_fit=200):
     y_fit = p(x_fit)
     return (x_fit,y_fit,poly_coef)
 
-def add_exp_to_database(working_dir, new_data_folder):
+def add_exp_to_database(working_dir, new_data_folder, reject_noisy_flash=False):
 
-    '''
+    '''Adds the experiments of new_data_folder to the database. The files are parsed out of
+    any lock so that several ingesters can work in parallel on disjoint sets of files; only the
+    writes to the database are serialized under the ingestion lock of working_dir, in short
+    per-batch transactions. The experiments already in the database, including the ones added
+    meanwhile by a concurrent ingester, are skipped.
+    
      Args:
         working_dir (str): full path of the folder containing the database.
         new_data_folder (str): full path of the folder containing the experiences to be added to the database.
+        reject_noisy_flash (bool): if True the flashes which sweeps are not repeatable (see compute_repeatability)
+            are not added (default: False).
     '''
     
     # Standard library imports 
     import os 
     from pathlib import Path
-
-    #3rd party imports
-    import pandas as pd
     
-    DATA_BASE_NAME = GLOBAL['DATA_BASE_NAME']
     DATA_BASE_TABLE_FILE = GLOBAL['DATA_BASE_TABLE_FILE']
     DATA_BASE_TABLE_EXP = GLOBAL['DATA_BASE_TABLE_EXP']
 
-    df_files_descp = sqlite_to_dataframe(working_dir, DATA_BASE_TABLE_FILE)
-    files_before_add = df_files_descp['file_full_path']
-
     files = [os.path.join(new_data_folder,file) for file in os.listdir(new_data_folder) if 
              Path(file).suffix=='.csv']
-
-    add_files_to_database(files,working_dir)
-    suppress_duplicate_database(working_dir)
-    df_files_descp = sqlite_to_dataframe(working_dir, DATA_BASE_TABLE_FILE)
-    files_after_add = df_files_descp['file_full_path']
     
-    added_files = list(set(files_after_add) - set(files_before_add))
+    conn = _connect(_database_path(working_dir))
+    known_exp_id = {x[0] for x in conn.execute(f"SELECT exp_id FROM {DATA_BASE_TABLE_FILE}")}
+    conn.close()
+    
+    new_files = {}
+    for file in files:
+        file_info = parse_filename(file)
+        if file_info.status and file_info.exp_id not in known_exp_id:
+            new_files.setdefault(file_info.exp_id, file)
+    
+    if not new_files:
+        print('The database is already up to date. No file has been added.')
+        return
+        
+    df_meta = build_df_meta(list(new_files.values()), working_dir=working_dir) # Parsing out of the lock
+    
+    if reject_noisy_flash:
+        list_noisy = list(df_meta.loc[df_meta['noisy_flash'] == 1, 'exp_id'])
+        for exp_id in list_noisy:
+            print(f'WARNING: the flash {new_files.pop(exp_id)} is not repeatable. It is not added to the database')
+        df_meta = df_meta[df_meta['noisy_flash'] != 1]
+        if not new_files:
+            print('The database is already up to date. No file has been added.')
+            return
+    
+    with ingestion_lock(working_dir):
+        added_files = add_files_to_database(list(new_files.values()), working_dir)
+        df_meta = df_meta[df_meta['exp_id'].isin({parse_filename(file).exp_id for file in added_files})]
+        if added_files:
+            conn = _connect(_database_path(working_dir))
+            with conn: # Single transaction
+                _append_dataframe(conn, df_meta, DATA_BASE_TABLE_EXP)
+                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{DATA_BASE_TABLE_EXP}_qc_flags ON {DATA_BASE_TABLE_EXP} (qc_flags)")
+            conn.close()
+            update_degradation_table(working_dir, list_module_type=df_meta['module_type'].unique())
+            if _table_exists(working_dir, GLOBAL['DATA_BASE_TABLE_CURVES']):
+                update_curve_store(working_dir, list(df_meta['exp_id']))
+    
     if added_files:
         x = "\n"
         print(f'the following {len(added_files)} files has been added :\n {x.join(added_files)}')
-        df_meta = build_df_meta(added_files)
-        df_meta_concat = pd.concat([sqlite_to_dataframe(working_dir,DATA_BASE_TABLE_EXP),df_meta],ignore_index=True)
-        # Builds a database
-        database_path = Path(working_dir) / Path(DATA_BASE_NAME)
-        df2sqlite(df_meta_concat, path_db=database_path, tbl_name=DATA_BASE_TABLE_EXP)
+        
+        # Checks that the modules of the added files have a complete set of experiments
+        missing = check_completeness(working_dir).missing
+        for module_type in sorted(set(df_meta['module_type']) & set(missing)):
+            print(f'WARNING: the experimental settings {missing[module_type]} are missing for the module {module_type}')
     else:
         print('The database is already up to date. No file has been added.')
 
-def build_df_meta(list_files): 
+def build_df_meta(list_files, workers=None, chunk_size=None, progress=None, working_dir=None): 
     ''' 
     build_df_meta is the master function used to build the dataframe df_meta.
     df_meta has index= module name and columns = `exp_idx` , GLOBAL['COL_NAMES'], `Isc_corr`, `Fill_Factor_corr`, `ìrradiance`,
@@ -1001,63 +1090,870 @@ def build_df_meta(list_files):
         `Isc_corr`, `Fill_Factor_corr` are the corrected values of Isc and of the fill factor
         
         `ìrradiance`,`treatment`, `module_type` are obtained by parsing the filename
+        
+    The list of files is split in chunks of chunk_size files which are processed in parallel
+    by a pool of workers processes if workers > 1. The rows of df_meta are in the order of list_files
+    whatever the number of workers. The worker processes are spawned on Windows and macOS: a script
+    calling build_df_meta, build_metadata_dataframe or add_exp_to_database with workers > 1
+    (GLOBAL['DF_META_MAX_WORKERS'] > 1) must then be guarded by if __name__ == '__main__':.
+    
+    If working_dir is not None, the values extracted out of the files content are memoised in the table
+    DATA_BASE_TABLE_DERIVED of the database, keyed by the sha1 hash of the file content, by DERIVATION_VERSION
+    and by the hash of the settings of the derivation (see _derivation_settings). Only the new or modified files,
+    or all the files after a change of the settings, are parsed.
     
     Args:
         list_files (list): list of files used to build the df_meta dataframe
+        workers (int): number of worker processes, 1 for a serial processing (default: GLOBAL['DF_META_MAX_WORKERS'], 1)
+        chunk_size (int): number of files processed by a worker in one go (default: GLOBAL['DF_META_CHUNK_SIZE'])
+        progress (function): callback progress(nbr_files_done, nbr_files) called each time a chunk is completed (default: None)
+        working_dir (path): path of the folder holding the database used as store (default: None, no memoisation)
     
     Returns:
         A dataframe containing the metadata (columns) of the list of experiences (rows)
     '''
+    
+    df_meta = _build_df_meta(list_files,
+                             parse_filename,
+                             {'irradiance': 'irradiance', 'treatment': 'treatment', 'module_type': 'module_type'},
+                             workers=workers,
+                             chunk_size=chunk_size,
+                             progress=progress,
+                             working_dir=working_dir)
+    
+    return df_meta
+
+def _build_df_meta(list_files, parse_func, dict_fields, workers=None, chunk_size=None, progress=None,
+                   working_dir=None):
+
+    '''Splits list_files in chunks, builds a partial df_meta per chunk with _build_df_meta_chunk,
+    on a process pool if workers > 1, and concatenates the partial results in the order of list_files.
+    
+    Args:
+        list_files (list): list of files used to build the df_meta dataframe
+        parse_func (function): parser of the filenames returning a namedtuple with an exp_id field
+        dict_fields (dict): {column name of df_meta: field of the namedtuple returned by parse_func}
+        workers, chunk_size, progress, working_dir: see build_df_meta
+    
+    Returns:
+        A dataframe containing the metadata (columns) of the list of experiences (rows)
+    '''
+
+    # Standard library imports 
+    import functools
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    
+    #3rd party imports
+    import pandas as pd
+    
+    if workers is None: workers = GLOBAL['DF_META_MAX_WORKERS']
+    if chunk_size is None: chunk_size = GLOBAL['DF_META_CHUNK_SIZE']
+    
+    dict_settings = _derivation_settings()
+    settings_hash = _settings_hash(dict_settings)
+    
+    list_files = list(list_files)
+    list_cached = [None]*len(list_files)
+    if working_dir is not None:
+        list_hash = [_content_hash(file) for file in list_files]
+        dict_store = _read_derived_store(working_dir, list_hash, settings_hash)
+        list_cached = [dict_store.get(content_hash) for content_hash in list_hash]
+    
+    list_chunks = [(list_files[idx:idx+chunk_size], list_cached[idx:idx+chunk_size]) 
+                   for idx in range(0, len(list_files), chunk_size)]
+    
+    # The settings are passed explicitly as GLOBAL may differ in the worker processes
+    build_chunk = functools.partial(_build_df_meta_chunk,
+                                    parse_func=parse_func,
+                                    dict_fields=dict_fields,
+                                    settings=dict_settings['IV_CORRECTION_DICT'],
+                                    step_settings=dict_settings['STEP_DETECTION_DICT'],
+                                    repeatability_settings=dict_settings['REPEATABILITY_THRESHOLD_DICT'],
+                                    qc_settings=dict_settings['QC_DICT'])
+    
+    list_df = [None]*len(list_chunks)
+    nbr_files_done = 0
+    if workers > 1 and len(list_chunks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(list_chunks))) as executor:
+            futures = {executor.submit(build_chunk, *chunk): idx for idx, chunk in enumerate(list_chunks)}
+            for future in as_completed(futures):
+                idx = futures[future]
+                list_df[idx] = future.result()
+                nbr_files_done += len(list_chunks[idx][0])
+                if progress is not None: progress(nbr_files_done, len(list_files))
+    else:
+        for idx, chunk in enumerate(list_chunks):
+            list_df[idx] = build_chunk(*chunk)
+            nbr_files_done += len(chunk[0])
+            if progress is not None: progress(nbr_files_done, len(list_files))
+    
+    if not list_df:
+        return _build_df_meta_chunk([], [], parse_func, dict_fields)
+    
+    df_meta = pd.concat(list_df)
+    
+    if working_dir is not None:
+        list_idx_new = [idx for idx, cached in enumerate(list_cached) if cached is None]
+        if list_idx_new:
+            _write_derived_store(working_dir,
+                                 df_meta.iloc[list_idx_new],
+                                 [list_hash[idx] for idx in list_idx_new],
+                                 settings_hash)
+    
+    return df_meta
+
+def _build_df_meta_chunk(list_files, list_cached, parse_func, dict_fields, settings=None, step_settings=None,
+                         repeatability_settings=None, qc_settings=None):
+
+    '''Builds the part of df_meta related to the files of list_files. 
+    The columns are stored in lists and the dataframe is built once at the end.
+    The files with a not None list_cached item (dict of the values extracted out of the file content)
+    are not read. The I/V curves are corrected with the settings (see correct_iv_curves), their steps
+    are detected with the step_settings (see detect_iv_steps), the repeatability of the sweeps is checked
+    against the repeatability_settings (see compute_repeatability) and the quality flags are computed
+    with the qc_settings (see compute_qc_flags).
+    This function is run by the worker processes of _build_df_meta.
+    '''
  
     # Standard library imports 
     import os
     
     #3rd party imports
-    import numpy as np
     import pandas as pd
     
     COL_NAMES = GLOBAL['COL_NAMES']
+    DERIVED_COLS = _derived_cols()
     
     # Building of the dataframe df_meta out of the flashtest files 
-    isc_corr = []
-    fill_factor_corr = []
+    dict_voltage = {sweep: [] for sweep in ('IV0', 'IV1', 'IV2')}
+    dict_current = {sweep: [] for sweep in ('IV0', 'IV1', 'IV2')}
+    list_idx_computed = []
+    list_invalid_counts = []
     list_files_name = []  # List of files basenames without extension
     list_dict_metadata = []
     list_exp_id = []
-    list_irradiance =[]
-    list_treatment = []
-    list_module_type = []
+    dict_columns = {col: [] for col in dict_fields}
     
-    for file in list_files:
-        iv_info = read_flashtest_file(file, parse_all=True)
-        list_dict_metadata.append(iv_info.meta_data)
-      
-        
-        # Compure the corrected Isc current and Fill Factor out of the I/V curves
-        voltage = iv_info.IV0["Voltage"]
-        current = iv_info.IV0["Current"]
-        corrected_current = correct_iv_curve(voltage,current)
-        isc_corr.append(np.round(corrected_current[0],3))
-        fill_factor_corr.append(np.round(max(voltage*current)/(corrected_current[0]*max(voltage)),3))
+    for idx, (file, cached) in enumerate(zip(list_files, list_cached)):
+        if cached is None:
+            iv_info = read_flashtest_file(file, parse_all=True)
+            list_dict_metadata.append(dict(iv_info.meta_data))
+            
+            # Collect the I/V curves to compute the corrected Isc current, Fill Factor and the
+            # repeatability of the sweeps in one batch
+            for sweep in dict_voltage:
+                dict_voltage[sweep].append(getattr(iv_info, sweep)["Voltage"].to_numpy())
+                dict_current[sweep].append(getattr(iv_info, sweep)["Current"].to_numpy())
+            list_idx_computed.append(idx)
+            
+            # Count the -1.#IND and blank values dropped by read_flashtest_file
+            list_invalid_counts.append(_count_invalid_values(file))
+        else:
+            list_dict_metadata.append(dict(cached))
         list_files_name.append(os.path.splitext(os.path.basename(file))[0])
         
-        # Add exp_id, irradiance, treatment, module_type from the filename prsing 
-        file_info = parse_filename(file)
+        # Add exp_id and the dict_fields from the filename parsing 
+        file_info = parse_func(file)
         list_exp_id.append(file_info.exp_id)
-        list_irradiance.append(file_info.irradiance)
-        list_treatment.append(file_info.treatment)
-        list_module_type.append(file_info.module_type)
+        for col, field in dict_fields.items():
+            dict_columns[col].append(getattr(file_info, field))
+    
+    if not list_files:
+        return pd.DataFrame(columns=['exp_id'] + DERIVED_COLS + list(dict_fields))
         
+    # Compute the corrected Isc current, Fill Factor, the steps, the sweeps repeatability and the quality flags 
+    # out of the I/V curves
+    if list_idx_computed:
+        voltage_sweeps, current_sweeps = zip(*[pack_iv_curves(dict_voltage[sweep], dict_current[sweep])
+                                               for sweep in dict_voltage])
+        voltage, current = voltage_sweeps[0], current_sweeps[0]
+        df_corrected = compute_corrected_parameters(voltage, current, settings=settings)
+        df_steps = detect_iv_steps(voltage, current, settings=step_settings)
+        df_repeatability = compute_repeatability(voltage_sweeps, current_sweeps, thresholds=repeatability_settings)
+        qc_flags = compute_qc_flags(voltage,
+                                    current,
+                                    pd.DataFrame([list_dict_metadata[idx] for idx in list_idx_computed],
+                                                 columns=['Pmax', 'Isc', 'Voc']),
+                                    invalid_counts=list_invalid_counts,
+                                    noisy_flash=df_repeatability['noisy_flash'],
+                                    thresholds=qc_settings)
+        for idx, corrected, steps, repeatability, flags in zip(list_idx_computed,
+                                                               df_corrected.to_dict('records'),
+                                                               df_steps.to_dict('records'),
+                                                               df_repeatability.to_dict('records'),
+                                                               qc_flags):
+            list_dict_metadata[idx].update(corrected)
+            list_dict_metadata[idx].update(steps)
+            list_dict_metadata[idx].update(repeatability)
+            list_dict_metadata[idx]['qc_flags'] = int(flags)
         
     df_meta = pd.DataFrame.from_dict(list_dict_metadata)
     df_meta.index = list_files_name    #df_meta['ID']
-    df_meta = df_meta.loc[:,COL_NAMES] # keep only the columns which names COL_NAMES 
-                                       #  defined in PVcharacterization_GUI.py
-    df_meta['Isc_corr'] = isc_corr
-    df_meta['Fill Factor_corr'] = fill_factor_corr
-    df_meta['irradiance'] = list_irradiance
-    df_meta['treatment'] = list_treatment
-    df_meta['module_type'] = list_module_type
+    df_meta = df_meta.loc[:,DERIVED_COLS] # keep only the columns which names COL_NAMES 
+                                          #  defined in PVcharacterization_GUI.py and the corrected values
+    for col, values in dict_columns.items():
+        df_meta[col] = values
     df_meta.insert(0, "exp_id", list_exp_id)
     
-    return df_meta
\ No newline at end of file
+    return df_meta
+
+def _derived_cols():
+
+    '''Returns the columns of df_meta derived from the files content.
+    '''
+    
+    return (GLOBAL['COL_NAMES'] + ['Isc_corr', 'Fill Factor_corr'] + CORRECTION_COLS + STEP_COLS
+            + REPEATABILITY_COLS + ['qc_flags'])
+
+def _derivation_settings():
+
+    '''Returns the settings on which the values of df_meta derived from the files content depend:
+    {GLOBAL key: settings dict} for the correction (IV_CORRECTION_DICT), the steps detection 
+    (STEP_DETECTION_DICT), the sweeps repeatability (REPEATABILITY_THRESHOLD_DICT) and the quality 
+    flags (QC_DICT).
+    '''
+    
+    return {key: dict(GLOBAL[key]) for key in ('IV_CORRECTION_DICT',
+                                               'QC_DICT',
+                                               'REPEATABILITY_THRESHOLD_DICT',
+                                               'STEP_DETECTION_DICT')}
+
+def _settings_hash(dict_settings):
+
+    '''Returns the sha1 hexdigest of the settings dict_settings (see _derivation_settings).
+    '''
+    
+    # Standard library imports
+    import hashlib
+    import json
+    
+    return hashlib.sha1(json.dumps(dict_settings, sort_keys=True, default=str).encode()).hexdigest()
+
+def _content_hash(file):
+
+    '''Returns the sha1 hexdigest of the content of file.
+    '''
+    
+    # Standard library imports
+    import hashlib
+    
+    sha1 = hashlib.sha1()
+    with open(file, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(block)
+            
+    return sha1.hexdigest()
+
+def _count_invalid_values(file):
+
+    '''Returns the number of -1.#IND and blank values of the data blocks (I/V and Ref cell curves) of a
+    flashtest file. The blank values are the empty fields of the partially filled rows; the empty
+    lines and the header block, where empty fields are legitimate, are not counted.
+    '''
+    
+    # Standard library imports
+    import re
+    
+    ENCODING = GLOBAL['ENCODING']
+    
+    nbr_invalid = 0
+    in_data = False
+    with open(file, encoding=ENCODING) as f:
+        for line in f:
+            fields = [field.strip() for field in line.rstrip('\r\n').split(',')]
+            if not in_data:
+                in_data = re.match(r'^\s?Volt|\s?Raw Voltage', fields[0]) is not None
+                continue
+            if not any(fields): continue
+            nbr_invalid += sum(1 for field in fields if field == '' or field == '-1.#IND')
+            
+    return nbr_invalid
+
+def _read_derived_store(working_dir, list_hash, settings_hash):
+
+    '''Reads the values memoised in the table DATA_BASE_TABLE_DERIVED for the content hashes list_hash,
+    the current DERIVATION_VERSION and the hash settings_hash of the current settings (see _settings_hash).
+    
+    Returns:
+        (dict): {content hash: {column: value}} for the hashes found in the store.
+    '''
+    
+    DATA_BASE_TABLE_DERIVED = GLOBAL['DATA_BASE_TABLE_DERIVED']
+    DERIVED_COLS = _derived_cols()
+    nbr_vars_max = 500 # Number of hashes per querry
+    
+    list_hash = list(set(list_hash))
+    conn = _connect(_database_path(working_dir))
+    table_exists = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?",
+                                (DATA_BASE_TABLE_DERIVED,)).fetchone()
+    dict_store = {}
+    if table_exists is not None:
+        table_cols = {x[1] for x in conn.execute(f"PRAGMA table_info({DATA_BASE_TABLE_DERIVED})").fetchall()}
+        if set(DERIVED_COLS + ['settings_hash']) <= table_cols:
+            cols = ', '.join([f'"{col}"' for col in DERIVED_COLS])
+            for idx in range(0, len(list_hash), nbr_vars_max):
+                list_hash_querry = list_hash[idx:idx+nbr_vars_max]
+                querry = (f"SELECT content_hash, {cols} FROM {DATA_BASE_TABLE_DERIVED} "
+                          f"WHERE derivation_version=? AND settings_hash=? "
+                          f"AND content_hash IN ({','.join(['?'] * len(list_hash_querry))})")
+                for row in conn.execute(querry, [DERIVATION_VERSION, settings_hash] + list_hash_querry):
+                    dict_store[row[0]] = dict(zip(DERIVED_COLS, row[1:]))
+    conn.close()
+    
+    return dict_store
+
+def _write_derived_store(working_dir, df_meta, list_hash, settings_hash):
+
+    '''Memoises the values of df_meta extracted out of the files content in the table DATA_BASE_TABLE_DERIVED
+    with the keys list_hash, DERIVATION_VERSION and settings_hash. The rows of the former derivation versions
+    are dropped and a single row, the last computed one whatever the settings, is kept per content hash.
+    '''
+    
+    DATA_BASE_TABLE_DERIVED = GLOBAL['DATA_BASE_TABLE_DERIVED']
+    DERIVED_COLS = _derived_cols()
+    
+    df_store = df_meta.loc[:, DERIVED_COLS].copy()
+    df_store.insert(0, 'settings_hash', settings_hash)
+    df_store.insert(0, 'derivation_version', DERIVATION_VERSION)
+    df_store.insert(0, 'content_hash', list_hash)
+    df_store = df_store.drop_duplicates('content_hash')
+    
+    with ingestion_lock(working_dir):
+        conn = _connect(_database_path(working_dir))
+        with conn: # Single transaction
+            table_exists = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?",
+                                        (DATA_BASE_TABLE_DERIVED,)).fetchone()
+            if table_exists is not None:
+                conn.execute(f"DELETE FROM {DATA_BASE_TABLE_DERIVED} WHERE derivation_version<>?",
+                             (DERIVATION_VERSION,))
+                conn.executemany(f"DELETE FROM {DATA_BASE_TABLE_DERIVED} WHERE content_hash=?",
+                                 [(x,) for x in df_store['content_hash']])
+            _append_dataframe(conn, df_store, DATA_BASE_TABLE_DERIVED)
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{DATA_BASE_TABLE_DERIVED}_content_hash "
+                         f"ON {DATA_BASE_TABLE_DERIVED} (content_hash, derivation_version)")
+        conn.close()
+        
+def _treatment_rank(treatments):
+
+    '''Returns the rank of the treatments: their index in GLOBAL['TREATMENT_DEFAULT_LIST'] or, for the 
+    treatments out of the list, the length of the list plus their numerical suffix (T10 ranks after T8 and T9)
+    or inf if they have no numerical suffix (compute_relative_diff then orders them by name).
+    
+    Args:
+        treatments (series): treatments names
+        
+    Returns:
+        (series): ranks of the treatments.
+    '''
+    
+    # 3rd party imports
+    import pandas as pd
+    
+    TREATMENT_DEFAULT_LIST = GLOBAL['TREATMENT_DEFAULT_LIST']
+    
+    treatments = pd.Series(treatments)
+    suffix_rank = len(TREATMENT_DEFAULT_LIST) + pd.to_numeric(treatments.str.extract(r'(\d+)$')[0])
+    rank = treatments.map({treatment: idx for idx, treatment in enumerate(TREATMENT_DEFAULT_LIST)})
+    
+    return rank.fillna(suffix_rank).fillna(float('inf')).astype(float)
+
+def compute_relative_diff(df_meta, list_params=None, list_diff=None):
+
+    '''Computes in one vectorized pass the relative variations (in %)
+        100*(param(Ti) - param(Tj))/param(Tj)
+    for every module type, irradiance and parameter and for every couple of treatments (Ti,Tj).
+    
+    Args:
+        df_meta (dataframe): dataframe built by build_df_meta
+        list_params (list of str): parameters to be processed (default: all the numerical parameters)
+        list_diff (list of tuples): list of (Ti,Tj). If None all the couples with Ti > Tj are processed,
+            the treatments being ordered by _treatment_rank.
+        
+    Returns:
+        (dataframe): dataframe with the columns module_type, irradiance, parameter, treatment_end (Ti),
+        treatment_ref (Tj), value_end, value_ref, rel_diff.
+    '''
+    
+    # 3rd party imports
+    import pandas as pd
+    
+    COL_NAMES = GLOBAL['COL_NAMES']
+    
+    keys = ['module_type', 'irradiance', 'treatment']
+    if list_params is None:
+        list_params = [x for x in COL_NAMES + ['Isc_corr','Fill Factor_corr']
+                       if x in df_meta.columns and x not in ['Title','exp_id']]
+        
+    df_long = df_meta.melt(id_vars=keys, value_vars=list_params, var_name='parameter', value_name='value')
+    df_diff = df_long.merge(df_long,
+                            on=['module_type', 'irradiance', 'parameter'],
+                            suffixes=('_end', '_ref'))
+    
+    if list_diff is None:
+        rank_end = _treatment_rank(df_diff['treatment_end'])
+        rank_ref = _treatment_rank(df_diff['treatment_ref'])
+        df_diff = df_diff[(rank_end > rank_ref) 
+                          | ((rank_end == rank_ref) & (df_diff['treatment_end'] > df_diff['treatment_ref']))]
+    else:
+        df_pairs = pd.DataFrame(list(list_diff), columns=['treatment_end', 'treatment_ref'])
+        df_diff = df_diff.merge(df_pairs, on=['treatment_end', 'treatment_ref'])
+    
+    df_diff['rel_diff'] = 100 * (df_diff['value_end'] - df_diff['value_ref']) / df_diff['value_ref']
+    df_diff = df_diff[['module_type', 'irradiance', 'parameter', 'treatment_end',
+                       'treatment_ref', 'value_end', 'value_ref', 'rel_diff']]
+    df_diff = df_diff.sort_values(['module_type', 'parameter', 'treatment_end', 'treatment_ref', 'irradiance'])
+    
+    return df_diff.reset_index(drop=True)
+    
+def update_degradation_table(working_dir, list_module_type=None):
+
+    '''Updates the table DATA_BASE_TABLE_DIFF of the relative parameters variations between
+    treatments (see compute_relative_diff) out of the table DATA_BASE_TABLE_EXP.
+    Only the rows of the modules list_module_type are recomputed. If list_module_type is None
+    the table is rebuilt.
+    
+    Args:
+        working_dir (path): path of the folder holding the database
+        list_module_type (list of str): modules type to be updated (default: None)
+    '''
+    
+    # Standard library imports
+    from pathlib import Path
+    
+    # 3rd party imports
+    import pandas as pd
+    
+    DATA_BASE_NAME = GLOBAL['DATA_BASE_NAME']
+    DATA_BASE_TABLE_EXP = GLOBAL['DATA_BASE_TABLE_EXP']
+    DATA_BASE_TABLE_DIFF = GLOBAL['DATA_BASE_TABLE_DIFF']
+    
+    database_path = Path(working_dir) / Path(DATA_BASE_NAME)
+    index_cols = [('module_type', 'parameter', 'treatment_end', 'treatment_ref')]
+    
+    if list_module_type is None:
+        df_meta = sqlite_to_dataframe(working_dir, DATA_BASE_TABLE_EXP)
+        df2sqlite(compute_relative_diff(df_meta),
+                  path_db=database_path,
+                  tbl_name=DATA_BASE_TABLE_DIFF,
+                  index_cols=index_cols)
+        return
+    
+    list_module_type = list(list_module_type)
+    placeholders = ','.join(['?'] * len(list_module_type))
+    conn = _connect(database_path)
+    df_meta = pd.read_sql_query(f"SELECT * FROM {DATA_BASE_TABLE_EXP} WHERE module_type IN ({placeholders})",
+                                conn,
+                                params=list_module_type)
+    df_diff = compute_relative_diff(df_meta)
+    
+    table_exists = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?",
+                                (DATA_BASE_TABLE_DIFF,)).fetchone()
+    if table_exists is None:
+        conn.close()
+        update_degradation_table(working_dir)
+        return
+        
+    with conn: # Single transaction
+        conn.execute(f"DELETE FROM {DATA_BASE_TABLE_DIFF} WHERE module_type IN ({placeholders})",
+                     list_module_type)
+        df_diff.to_sql(DATA_BASE_TABLE_DIFF, conn, if_exists='append', index=False)
+    conn.close()
+    
+def read_degradation_table(working_dir, list_mod_selected, list_params=None, list_diff=None):
+
+    '''Reads the precomputed relative parameters variations of the table DATA_BASE_TABLE_DIFF.
+    
+    Args:
+        working_dir (path): path of the folder holding the database
+        list_mod_selected (list of str): list of module types
+        list_params (list of str): list of parameters (default: all the parameters)
+        list_diff (list of tuples): list of (Ti,Tj) (default: all the couples)
+        
+    Returns:
+        (dataframe): dataframe with the same columns as compute_relative_diff.
+    '''
+    
+    # 3rd party imports
+    import pandas as pd
+    
+    DATA_BASE_TABLE_DIFF = GLOBAL['DATA_BASE_TABLE_DIFF']
+    
+    list_mod_selected = list(list_mod_selected)
+    querry = f"SELECT * FROM {DATA_BASE_TABLE_DIFF} WHERE module_type IN ({','.join(['?'] * len(list_mod_selected))})"
+    params = list_mod_selected
+    if list_params is not None:
+        querry += f" AND parameter IN ({','.join(['?'] * len(list_params))})"
+        params = params + list(list_params)
+        
+    database_path = _database_path(working_dir)
+    conn = _connect(database_path)
+    df_diff = pd.read_sql_query(querry, conn, params=params)
+    conn.close()
+    
+    if list_diff is not None:
+        df_pairs = pd.DataFrame(list(list_diff), columns=['treatment_end', 'treatment_ref'])
+        df_diff = df_diff.merge(df_pairs, on=['treatment_end', 'treatment_ref'])
+        
+    return df_diff
+
+def update_discrepancy_table(working_dir, list_exp_id=None):
+
+    '''Updates the table DATA_BASE_TABLE_DISCREPANCY comparing the parameters Pmax, Vpm, Ipm, Voc, Isc
+    and Fill Factor of the files headers to the ones computed out of the IV0 curves by compute_iv_features.
+    The table has the columns exp_id, parameter, header_value, curve_value and rel_diff where
+        rel_diff = 100*(curve_value - header_value)/header_value.
+    Only the rows of the experiments list_exp_id are recomputed. If list_exp_id is None the table is rebuilt.
+    
+    Args:
+        working_dir (path): path of the folder holding the database
+        list_exp_id (list of str): experiments to be updated (default: None)
+    '''
+    
+    # Standard library imports
+    from pathlib import Path
+    
+    # 3rd party imports
+    import pandas as pd
+    
+    DATA_BASE_NAME = GLOBAL['DATA_BASE_NAME']
+    DATA_BASE_TABLE_DISCREPANCY = GLOBAL['DATA_BASE_TABLE_DISCREPANCY']
+    
+    database_path = Path(working_dir) / Path(DATA_BASE_NAME)
+    
+    conn = _connect(database_path)
+    table_exists = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?",
+                                (DATA_BASE_TABLE_DISCREPANCY,)).fetchone()
+    conn.close()
+    if table_exists is None: list_exp_id = None
+    
+    list_exp, list_header, list_voltage, list_current, _ = _read_iv_curves(working_dir, list_exp_id)
+    if not list_exp:
+        return
+    
+    df_curve = compute_iv_features(*pack_iv_curves(list_voltage, list_current))
+    df_header = pd.DataFrame(list_header, columns=df_curve.columns).apply(pd.to_numeric, errors='coerce')
+    df_curve.insert(0, 'exp_id', list_exp)
+    df_header.insert(0, 'exp_id', list_exp)
+    
+    df_discrepancy = pd.merge(df_header.melt(id_vars='exp_id', var_name='parameter', value_name='header_value'),
+                              df_curve.melt(id_vars='exp_id', var_name='parameter', value_name='curve_value'),
+                              on=['exp_id', 'parameter'])
+    df_discrepancy['rel_diff'] = 100 * (df_discrepancy['curve_value'] - df_discrepancy['header_value']) \
+                                     / df_discrepancy['header_value']
+    
+    with ingestion_lock(working_dir):
+        if list_exp_id is None:
+            df2sqlite(df_discrepancy,
+                      path_db=database_path,
+                      tbl_name=DATA_BASE_TABLE_DISCREPANCY,
+                      index_cols=[('exp_id', 'parameter')])
+            return
+            
+        conn = _connect(database_path)
+        with conn: # Single transaction
+            conn.execute(f"DELETE FROM {DATA_BASE_TABLE_DISCREPANCY} WHERE exp_id IN ({','.join(['?'] * len(list_exp))})",
+                         list_exp)
+            df_discrepancy.to_sql(DATA_BASE_TABLE_DISCREPANCY, conn, if_exists='append', index=False)
+        conn.close()
+
+def _read_iv_curves(working_dir, list_exp_id=None, sweep='IV0'):
+
+    '''Reads the headers and the I/V curves sweep of the flashtest files of the experiments list_exp_id
+    registered in the table DATA_BASE_TABLE_FILE. If the curve store holds the sweep and the reference
+    cell irradiance of all the experiments and the table DATA_BASE_TABLE_EXP their headers, the curves
+    are loaded out of the store and the headers out of the table (see _read_stored_iv_curves); otherwise
+    the flashtest files are parsed.
+    
+    Args:
+        working_dir (path): path of the folder holding the database
+        list_exp_id (list of str): experiments to be read (default: None, all the experiments)
+        sweep (str): IV0, IV1 or IV2 (default: IV0)
+    
+    Returns:
+        (tuple of lists): list_exp_id, list_header, list_voltage, list_current, list_irradiance in the order
+        of the table where list_irradiance is the mean reference cell irradiance of the sweep.
+    '''
+    
+    DATA_BASE_TABLE_FILE = GLOBAL['DATA_BASE_TABLE_FILE']
+    
+    querry = f"SELECT exp_id, file_full_path FROM {DATA_BASE_TABLE_FILE}"
+    params = []
+    if list_exp_id is not None:
+        params = list(list_exp_id)
+        querry += f" WHERE exp_id IN ({','.join(['?'] * len(params))})"
+    conn = _connect(_database_path(working_dir))
+    list_rows = conn.execute(querry, params).fetchall()
+    conn.close()
+    
+    stored = _read_stored_iv_curves(working_dir, [row[0] for row in list_rows], sweep)
+    if stored is not None:
+        return stored
+    
+    list_exp = []
+    list_header = []
+    list_voltage = []
+    list_current = []
+    list_irradiance = []
+    for exp_id, file in list_rows:
+        iv_info = read_flashtest_file(file, parse_all=True)
+        list_exp.append(exp_id)
+        list_header.append(iv_info.meta_data)
+        list_voltage.append(getattr(iv_info, sweep)["Voltage"].to_numpy())
+        list_current.append(getattr(iv_info, sweep)["Current"].to_numpy())
+        ref_cell = getattr(iv_info, f'Ref_Cell{sweep[-1]}')
+        list_irradiance.append(ref_cell["Ref_Cell"].mean() if ref_cell is not None else float('nan'))
+        
+    return list_exp, list_header, list_voltage, list_current, list_irradiance
+
+def _read_stored_iv_curves(working_dir, list_exp_id, sweep):
+
+    '''Reads the same values as _read_iv_curves for the experiments list_exp_id: the I/V curves and the
+    reference cell irradiance of the sweep out of the curve store, the headers out of the table
+    DATA_BASE_TABLE_EXP.
+    
+    Returns:
+        (tuple of lists): see _read_iv_curves or None if the store or the table DATA_BASE_TABLE_EXP
+        miss some of the experiments.
+    '''
+    
+    DATA_BASE_TABLE_CURVES = GLOBAL['DATA_BASE_TABLE_CURVES']
+    DATA_BASE_TABLE_EXP = GLOBAL['DATA_BASE_TABLE_EXP']
+    
+    if not (_table_exists(working_dir, DATA_BASE_TABLE_CURVES) and _table_exists(working_dir, DATA_BASE_TABLE_EXP)):
+        return None
+    
+    conn = _connect(_database_path(working_dir))
+    curves_cols = [x[1] for x in conn.execute(f"PRAGMA table_info({DATA_BASE_TABLE_CURVES})").fetchall()]
+    exp_cols = [x[1] for x in conn.execute(f"PRAGMA table_info({DATA_BASE_TABLE_EXP})").fetchall()]
+    header_cols = [col for col in GLOBAL['COL_NAMES'] if col in exp_cols]
+    if 'ref_cell_irradiance' not in curves_cols:
+        conn.close()
+        return None
+    dict_irradiance = dict(conn.execute(f'''SELECT exp_id, ref_cell_irradiance FROM {DATA_BASE_TABLE_CURVES} 
+                                           WHERE sweep=? AND ref_cell_irradiance IS NOT NULL''', (sweep,)).fetchall())
+    cols = ', '.join([f'"{col}"' for col in header_cols])
+    dict_header = {row[0]: dict(zip(header_cols, row[1:]))
+                   for row in conn.execute(f"SELECT exp_id, {cols} FROM {DATA_BASE_TABLE_EXP}").fetchall()}
+    conn.close()
+    
+    if not all(exp_id in dict_irradiance and exp_id in dict_header for exp_id in list_exp_id):
+        return None
+    
+    curves = load_iv_curves(working_dir, list_exp_id, sweep=sweep)
+    if curves.exp_id != list(list_exp_id):
+        return None
+    
+    return (curves.exp_id,
+            [dict_header[exp_id] for exp_id in curves.exp_id],
+            curves.voltage,
+            curves.current,
+            [dict_irradiance[exp_id] for exp_id in curves.exp_id])
+
+def update_single_diode_parameters(working_dir, list_exp_id=None, cells_in_series=None, workers=None):
+
+    '''Fits the single diode model to the IV0 curves of the curve store (see fit_single_diode) and stores 
+    the fitted parameters in the columns Iph_fit, I0_fit, n_fit, Rs_fit, Rsh_fit and rmse_fit of the table
+    DATA_BASE_TABLE_EXP. The experiments missing in the curve store are added to it first.
+    
+    Args:
+        working_dir (path): path of the folder holding the database
+        list_exp_id (list of str): experiments to be fitted (default: None, all the experiments)
+        cells_in_series (int): number of cells in series (default: GLOBAL['SINGLE_DIODE_DICT']['cells_in_series'])
+        workers (int): number of worker processes, see fit_single_diode (default: GLOBAL['SINGLE_DIODE_DICT']['workers'])
+        
+    Returns:
+        (dataframe): the fitted parameters with the column exp_id.
+    '''
+    
+    DATA_BASE_TABLE_EXP = GLOBAL['DATA_BASE_TABLE_EXP']
+    
+    update_curve_store(working_dir, list_exp_id)
+    curves = load_iv_curves(working_dir, list_exp_id, sweep='IV0')
+    if not curves.exp_id:
+        return None
+    
+    df_fit = fit_single_diode(*pack_iv_curves(curves.voltage, curves.current),
+                              cells_in_series=cells_in_series,
+                              workers=workers)
+    df_fit.columns = [f'{col}_fit' for col in df_fit.columns]
+    df_fit.insert(0, 'exp_id', curves.exp_id)
+    
+    with ingestion_lock(working_dir):
+        conn = _connect(_database_path(working_dir))
+        with conn: # Single transaction
+            _update_columns(conn, df_fit, DATA_BASE_TABLE_EXP)
+        conn.close()
+        
+    return df_fit
+
+def update_iec60891_parameters(working_dir, list_exp_id=None, target_irradiance=None, coefficients=None):
+
+    '''Translates the IV0 curves to the target conditions with correct_iec60891, using the mean
+    reference cell irradiance of the flash as measured irradiance, and stores the parameters of the
+    corrected curves (see compute_iv_features) in the columns Pmax_60891, Vpm_60891, Ipm_60891,
+    Voc_60891, Isc_60891, Fill Factor_60891 of the table DATA_BASE_TABLE_EXP together with the
+    measured irradiance Ref_Cell_irradiance.
+    
+    Args:
+        working_dir (path): path of the folder holding the database
+        list_exp_id (list of str): experiments to be corrected (default: None, all the experiments)
+        target_irradiance (float): target irradiance in W/m2 (default: None, the nominal irradiance of each 
+            experiment parsed out of its filename)
+        coefficients (dict): module coefficients, see correct_iec60891 (default: GLOBAL['IEC60891_DICT'])
+        
+    Returns:
+        (dataframe): the corrected parameters with the column exp_id.
+    '''
+    
+    # 3rd party imports
+    import numpy as np
+    
+    DATA_BASE_TABLE_FILE = GLOBAL['DATA_BASE_TABLE_FILE']
+    DATA_BASE_TABLE_EXP = GLOBAL['DATA_BASE_TABLE_EXP']
+    
+    list_exp, _, list_voltage, list_current, list_irradiance = _read_iv_curves(working_dir, list_exp_id)
+    if not list_exp:
+        return None
+    
+    if target_irradiance is None:
+        conn = _connect(_database_path(working_dir))
+        dict_irradiance = dict(conn.execute(f"SELECT exp_id, irradiance FROM {DATA_BASE_TABLE_FILE}").fetchall())
+        conn.close()
+        target_irradiance = np.array([dict_irradiance[exp_id] for exp_id in list_exp], dtype=float)
+    
+    voltage, current = correct_iec60891(*pack_iv_curves(list_voltage, list_current),
+                                        irradiance=list_irradiance,
+                                        target_irradiance=target_irradiance,
+                                        coefficients=coefficients)
+    df_iec = compute_iv_features(voltage, current)
+    df_iec.columns = [f'{col}_60891' for col in df_iec.columns]
+    df_iec.insert(0, 'exp_id', list_exp)
+    df_iec['Ref_Cell_irradiance'] = list_irradiance
+    
+    with ingestion_lock(working_dir):
+        conn = _connect(_database_path(working_dir))
+        with conn: # Single transaction
+            _update_columns(conn, df_iec, DATA_BASE_TABLE_EXP)
+        conn.close()
+        
+    return df_iec
+
+def recompute_corrected_parameters(working_dir, settings=None):
+
+    '''Recomputes the columns Isc_corr and Fill Factor_corr of the table DATA_BASE_TABLE_EXP with new
+    settings of correct_iv_curves out of the IV0 curves of the curve store, without parsing the flashtest
+    files, and records the settings in the columns corr_min_voltage_fit, corr_max_voltage_fit,
+    corr_error_max and corr_isc_method. The experiments missing in the curve store are added to it first. The table
+    DATA_BASE_TABLE_DIFF is then rebuilt.
+    
+    Args:
+        working_dir (path): path of the folder holding the database
+        settings (dict): see correct_iv_curves (default: GLOBAL['IV_CORRECTION_DICT'])
+        
+    Returns:
+        (dataframe): the recomputed parameters with the column exp_id.
+    '''
+    
+    DATA_BASE_TABLE_EXP = GLOBAL['DATA_BASE_TABLE_EXP']
+    
+    if settings is None: settings = GLOBAL['IV_CORRECTION_DICT']
+    
+    conn = _connect(_database_path(working_dir))
+    list_exp_id = [x[0] for x in conn.execute(f"SELECT exp_id FROM {DATA_BASE_TABLE_EXP}").fetchall()]
+    conn.close()
+    update_curve_store(working_dir, list_exp_id)
+    
+    curves = load_iv_curves(working_dir, list_exp_id, sweep='IV0')
+    if not curves.exp_id:
+        return None
+    
+    df_corrected = compute_corrected_parameters(*pack_iv_curves(curves.voltage, curves.current),
+                                                settings=settings)
+    df_corrected.insert(0, 'exp_id', curves.exp_id)
+    
+    with ingestion_lock(working_dir):
+        conn = _connect(_database_path(working_dir))
+        with conn: # Single transaction
+            _update_columns(conn, df_corrected, DATA_BASE_TABLE_EXP)
+        conn.close()
+        update_degradation_table(working_dir)
+        
+    return df_corrected
+
+def update_slope_resistances(working_dir, list_exp_id=None, settings=None):
+
+    '''Computes the slope resistances Rs0 and Rsh0 of the IV0 curves of the curve store (see
+    compute_slope_resistances) and stores them in the columns Rs0 and Rsh0 of the table DATA_BASE_TABLE_EXP.
+    The experiments missing in the curve store are added to it first.
+    
+    Args:
+        working_dir (path): path of the folder holding the database
+        list_exp_id (list of str): experiments to be processed (default: None, all the experiments)
+        settings (dict): Savitzky-Golay settings, see compute_slope_resistances (default: GLOBAL['SAVGOL_DICT'])
+        
+    Returns:
+        (dataframe): the slope resistances with the column exp_id.
+    '''
+    
+    DATA_BASE_TABLE_EXP = GLOBAL['DATA_BASE_TABLE_EXP']
+    
+    if list_exp_id is None:
+        conn = _connect(_database_path(working_dir))
+        list_exp_id = [x[0] for x in conn.execute(f"SELECT exp_id FROM {DATA_BASE_TABLE_EXP}").fetchall()]
+        conn.close()
+    update_curve_store(working_dir, list_exp_id)
+    
+    curves = load_iv_curves(working_dir, list_exp_id, sweep='IV0')
+    if not curves.exp_id:
+        return None
+    
+    df_resistance = compute_slope_resistances(*pack_iv_curves(curves.voltage, curves.current),
+                                              settings=settings)
+    df_resistance.insert(0, 'exp_id', curves.exp_id)
+    
+    with ingestion_lock(working_dir):
+        conn = _connect(_database_path(working_dir))
+        with conn: # Single transaction
+            _update_columns(conn, df_resistance, DATA_BASE_TABLE_EXP)
+        conn.close()
+        
+    return df_resistance
+
+def update_iv_steps(working_dir, list_exp_id=None, settings=None):
+
+    '''Detects the steps of the IV0 curves of the curve store (see detect_iv_steps) and stores them in the
+    columns step_count and step_voltages of the table DATA_BASE_TABLE_EXP. The steps are detected at ingestion;
+    this function reruns the detection, for instance with new settings, without parsing the flashtest files.
+    The experiments missing in the curve store are added to it first.
+    
+    Args:
+        working_dir (path): path of the folder holding the database
+        list_exp_id (list of str): experiments to be processed (default: None, all the experiments)
+        settings (dict): step detection settings, see detect_iv_steps (default: GLOBAL['STEP_DETECTION_DICT'])
+        
+    Returns:
+        (dataframe): the steps with the column exp_id.
+    '''
+    
+    DATA_BASE_TABLE_EXP = GLOBAL['DATA_BASE_TABLE_EXP']
+    
+    if list_exp_id is None:
+        conn = _connect(_database_path(working_dir))
+        list_exp_id = [x[0] for x in conn.execute(f"SELECT exp_id FROM {DATA_BASE_TABLE_EXP}").fetchall()]
+        conn.close()
+    update_curve_store(working_dir, list_exp_id)
+    
+    curves = load_iv_curves(working_dir, list_exp_id, sweep='IV0')
+    if not curves.exp_id:
+        return None
+    
+    df_steps = detect_iv_steps(*pack_iv_curves(curves.voltage, curves.current), settings=settings)
+    df_steps.insert(0, 'exp_id', curves.exp_id)
+    
+    with ingestion_lock(working_dir):
+        conn = _connect(_database_path(working_dir))
+        with conn: # Single transaction
+            _update_columns(conn, df_steps, DATA_BASE_TABLE_EXP)
+        conn.close()
+        
+    return df_steps
@@ -0,0 +1,1188 @@
+''' Creation: 2022.10.19
+    Last update: 2022.10.19
+
+    Batched processing of I/V curves. The curves are handled either as:
+       - a padded batch: two 2-D arrays voltage[n_curves, n_points_max], current[n_curves, n_points_max]
+         where the curves are left aligned and padded with NaN;
+       - a ragged batch: two 1-D arrays holding the concatenated curves and an array offsets of
+         n_curves+1 indices such that the curve k is values[offsets[k]:offsets[k+1]].
+    The voltages of each curve are supposed to be sorted in ascending order as returned by
+    read_flashtest_file.
+'''
+
+__all__ = [
+    "QC_FEW_SAMPLES",
+    "QC_HEADER_MISMATCH",
+    "QC_INVALID_VALUES",
+    "QC_NOISY_FLASH",
+    "QC_NON_MONOTONIC_VOLTAGE",
+    "QC_PLATEAU",
+    "apply_savgol_filter_1d",
+    "compute_corrected_parameters",
+    "compute_iv_features",
+    "compute_qc_flags",
+    "compute_repeatability",
+    "compute_slope_resistances",
+    "correct_iec60891",
+    "correct_iv_curves",
+    "detect_iv_steps",
+    "fit_low_voltage_line",
+    "fit_single_diode",
+    "pack_iv_curves",
+    "padded_to_ragged",
+    "ragged_to_padded",
+    "resample_iv_curves",
+    "sgolay1d_kernel",
+    "single_diode_current",
+]
+
+#Internal imports
+from .config import GLOBAL
+
+# Version of the values derived from the files content. It must be incremented each time the
+# derivation code (correct_iv_curves, build_df_meta) changes so that the memoised values are recomputed.
+DERIVATION_VERSION = 8
+
+# Columns recording the settings of correct_iv_curves (see compute_corrected_parameters)
+CORRECTION_COLS = ['corr_min_voltage_fit', 'corr_max_voltage_fit', 'corr_error_max', 'corr_isc_method']
+
+# Columns of the dataframe returned by detect_iv_steps
+STEP_COLS = ['step_count', 'step_voltages']
+
+# Columns of the dataframe returned by compute_repeatability
+REPEATABILITY_COLS = ['Pmax_spread', 'Isc_spread', 'Voc_spread', 'IV_max_deviation', 'noisy_flash']
+
+# Bits of the quality flags returned by compute_qc_flags
+QC_NON_MONOTONIC_VOLTAGE = 1  # the voltage is not strictly increasing
+QC_INVALID_VALUES = 2         # the data blocks of the file contain -1.#IND or blank values
+QC_PLATEAU = 4                # the current is not linear between 0 and Voc/2
+QC_HEADER_MISMATCH = 8        # Pmax, Isc or Voc of the header differs from the one of the curve
+QC_FEW_SAMPLES = 16           # the curve has too few points
+QC_NOISY_FLASH = 32           # the sweeps are not repeatable (see compute_repeatability)
+
+def pack_iv_curves(list_voltage, list_current):
+
+    '''Packs a list of I/V curves in a padded batch.
+
+    Args:
+        list_voltage (list of arrays): list of the voltages of the curves
+        list_current (list of arrays): list of the currents of the curves
+
+    Returns:
+        (tuple of arrays): (voltage, current) padded 2-D arrays of shape (n_curves, n_points_max).
+    '''
+
+    # 3rd party imports
+    import numpy as np
+
+    offsets = np.concatenate([[0], np.cumsum([len(x) for x in list_voltage])])
+    voltage = ragged_to_padded(np.concatenate([np.asarray(x, dtype=float) for x in list_voltage]), offsets)
+    current = ragged_to_padded(np.concatenate([np.asarray(x, dtype=float) for x in list_current]), offsets)
+
+    return voltage, current
+
+def ragged_to_padded(values, offsets, fill_value=float('nan')):
+
+    '''Converts a ragged batch (values, offsets) in a padded 2-D array.
+
+    Args:
+        values (array): concatenated values of the curves
+        offsets (array): n_curves+1 indices of the beginning of the curves in values
+        fill_value (float): padding value (default: NaN)
+
+    Returns:
+        (array): padded array of shape (n_curves, n_points_max).
+    '''
+
+    # 3rd party imports
+    import numpy as np
+
+    offsets = np.asarray(offsets)
+    lengths = np.diff(offsets)
+    n_points_max = lengths.max() if len(lengths) else 0
+
+    padded = np.full((len(lengths), n_points_max), fill_value, dtype=float)
+    mask = np.arange(n_points_max)[np.newaxis, :] < lengths[:, np.newaxis]
+    padded[mask] = values[offsets[0]:offsets[-1]]
+
+    return padded
+
+def padded_to_ragged(padded, offsets):
+
+    '''Converts a padded 2-D array in the values of a ragged batch described by offsets.
+
+    Args:
+        padded (array): padded array of shape (n_curves, n_points_max)
+        offsets (array): n_curves+1 indices of the beginning of the curves
+
+    Returns:
+        (array): concatenated values of the curves.
+    '''
+
+    # 3rd party imports
+    import numpy as np
+
+    lengths = np.diff(np.asarray(offsets))
+    mask = np.arange(padded.shape[1])[np.newaxis, :] < lengths[:, np.newaxis]
+
+    return padded[mask]
+
+def _linear_fit(x, y, mask, weights=None):
+
+    '''Least square fits y = slope*x + intercept of all the rows of the 2-D arrays x, y
+    restricted to the points where mask is True. The normal equations of all the fits are
+    solved at once. If weights is not None, the residuals are weighted by the 2-D array weights.
+
+    Returns:
+        (tuple of arrays): (slope, intercept) of shape (n_curves,).
+    '''
+
+    # 3rd party imports
+    import numpy as np
+
+    w = mask.astype(float) if weights is None else np.where(mask, weights, 0)
+    x = np.where(mask, x, 0)
+    y = np.where(mask, y, 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        w_sum = w.sum(axis=1)
+        x_mean = (w * x).sum(axis=1) / w_sum
+        y_mean = (w * y).sum(axis=1) / w_sum
+        dx = np.where(mask, x - x_mean[:, np.newaxis], 0)
+        dy = np.where(mask, y - y_mean[:, np.newaxis], 0)
+        slope = (w * dx * dy).sum(axis=1) / (w * dx * dx).sum(axis=1)
+    intercept = y_mean - slope * x_mean
+
+    return slope, intercept
+
+def _fit_lsq(voltage, current, mask, settings):
+
+    '''Least square line fit of the low voltage region of the curves.
+    '''
+
+    return _linear_fit(voltage, current, mask)
+
+def _fit_huber(voltage, current, mask, settings):
+
+    '''Huber line fit of the low voltage region of the curves by iteratively reweighted least squares.
+    The iterations start from the RANSAC line (see _fit_ransac), not from the least squares one which
+    is dragged by the outliers, and the scale sigma is the robust standard deviation (1.4826 MAD) of the
+    residuals of this start line, kept fixed. The residuals larger than huber_k*sigma are downweighted by
+    huber_k*sigma/|residual|.
+    '''
+
+    # Standard library imports
+    import warnings
+
+    # 3rd party imports
+    import numpy as np
+
+    huber_k = settings.get('huber_k', 1.345)
+    n_iter = 20
+
+    slope, intercept = _fit_ransac(voltage, current, mask, settings)
+    residual = np.where(mask, current - slope[:, np.newaxis] * voltage - intercept[:, np.newaxis], np.nan)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning) # All-NaN rows
+        deviation = np.abs(residual - np.nanmedian(residual, axis=1)[:, np.newaxis])
+        sigma = 1.4826 * np.nanmedian(deviation, axis=1)
+    for _ in range(n_iter):
+        residual = np.where(mask, current - slope[:, np.newaxis] * voltage - intercept[:, np.newaxis], np.nan)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weights = np.minimum(1, huber_k * sigma[:, np.newaxis] / np.abs(residual))
+        weights = np.where(np.isnan(weights), 1, weights)
+        slope_new, intercept_new = _linear_fit(voltage, current, mask, weights)
+        converged = np.allclose(slope_new, slope, rtol=1e-10, atol=0, equal_nan=True)
+        slope, intercept = slope_new, intercept_new
+        if converged: break
+
+    return slope, intercept
+
+def _fit_ransac(voltage, current, mask, settings):
+
+    '''RANSAC line fit of the low voltage region of the curves. Lines through random pairs of points of
+    the region are drawn for all the curves at once, ransac_trials per curve. The line with the largest
+    number of inliers, the points which current is within ransac_threshold % of the median current of
+    the region, is kept and refitted by least squares on its inliers. The draw is seeded so the estimate
+    of a curve is reproducible.
+    '''
+
+    # Standard library imports
+    import warnings
+
+    # 3rd party imports
+    import numpy as np
+
+    n_trials = settings.get('ransac_trials', 100)
+    threshold = settings.get('ransac_threshold', 0.3)
+    trials_per_block = 10
+
+    rng = np.random.default_rng(0)
+    n_curves = voltage.shape[0]
+    rows = np.arange(n_curves)[:, np.newaxis]
+    n_region = mask.sum(axis=1)
+    idx_first = np.argmax(mask, axis=1)  # The region is contiguous as the voltages are sorted
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning) # All-NaN rows
+        tolerance = threshold / 100 * np.abs(np.nanmedian(np.where(mask, current, np.nan), axis=1))
+
+    best_count = np.full(n_curves, -1)
+    best_slope = np.full(n_curves, np.nan)
+    best_intercept = np.full(n_curves, np.nan)
+    for idx_trial in range(0, n_trials, trials_per_block):
+        n_block = min(trials_per_block, n_trials - idx_trial)
+        idx_i, idx_j = (idx_first[:, np.newaxis]
+                        + np.floor(rng.random((2, n_curves, n_block)) * n_region[:, np.newaxis]).astype(int))
+        idx_i = np.minimum(idx_i, voltage.shape[1] - 1)
+        idx_j = np.minimum(idx_j, voltage.shape[1] - 1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            slope = (current[rows, idx_j] - current[rows, idx_i]) / (voltage[rows, idx_j] - voltage[rows, idx_i])
+            intercept = current[rows, idx_i] - slope * voltage[rows, idx_i]
+            residual = (current[:, np.newaxis, :] - slope[:, :, np.newaxis] * voltage[:, np.newaxis, :]
+                        - intercept[:, :, np.newaxis])
+            count = (mask[:, np.newaxis, :] & (np.abs(residual) <= tolerance[:, np.newaxis, np.newaxis])).sum(axis=2)
+        count = np.where(np.isfinite(slope), count, -1)
+        idx_best = np.argmax(count, axis=1)
+        count_best = count[rows[:, 0], idx_best]
+        better = count_best > best_count
+        best_count = np.where(better, count_best, best_count)
+        best_slope = np.where(better, slope[rows[:, 0], idx_best], best_slope)
+        best_intercept = np.where(better, intercept[rows[:, 0], idx_best], best_intercept)
+
+    with np.errstate(invalid='ignore'):
+        inliers = mask & (np.abs(current - best_slope[:, np.newaxis] * voltage - best_intercept[:, np.newaxis])
+                          <= tolerance[:, np.newaxis])
+    slope, intercept = _linear_fit(voltage, current, inliers)
+    refit = inliers.sum(axis=1) >= 2
+    
+    return np.where(refit, slope, best_slope), np.where(refit, intercept, best_intercept)
+
+# Line fits of the low voltage region of the I/V curves selected by the setting isc_method
+ISC_ESTIMATORS = {'lsq': _fit_lsq,
+                  'huber': _fit_huber,
+                  'ransac': _fit_ransac}
+
+def fit_low_voltage_line(voltage, current, offsets=None, settings=None):
+
+    '''Fits all at once the I/V curves between min_voltage_fit and max_voltage_fit by a line
+    with the estimator settings['isc_method'] of ISC_ESTIMATORS:
+       - 'lsq': least squares;
+       - 'huber': Huber regression, insensitive to the few capacitive artefacts of the low voltage region;
+       - 'ransac': RANSAC, insensitive to a large fraction of outliers.
+    The intercept of the line is the estimate of the short circuit current Isc.
+
+    Args:
+        voltage (array): padded 2-D array of voltages or concatenated voltages if offsets is not None
+        current (array): padded 2-D array of currents or concatenated currents if offsets is not None
+        offsets (array): n_curves+1 indices of the beginning of the curves for a ragged batch (default: None)
+        settings (dict): see correct_iv_curves (default: GLOBAL['IV_CORRECTION_DICT'])
+
+    Returns:
+        (tuple of arrays): (slope, intercept) of shape (n_curves,).
+    '''
+
+    # 3rd party imports
+    import numpy as np
+
+    if settings is None: settings = GLOBAL['IV_CORRECTION_DICT']
+    isc_method = settings.get('isc_method', 'lsq')
+    if isc_method not in ISC_ESTIMATORS:
+        raise Exception(f"Sorry, the Isc estimator must be one of {', '.join(ISC_ESTIMATORS)}")
+
+    if offsets is not None:
+        voltage = ragged_to_padded(voltage, offsets)
+        current = ragged_to_padded(current, offsets)
+
+    voltage = np.asarray(voltage, dtype=float)
+    current = np.asarray(current, dtype=float)
+    with np.errstate(invalid='ignore'):
+        mask = (~np.isnan(current)
+                & (voltage >= settings['min_voltage_fit'])
+                & (voltage < settings['max_voltage_fit']))
+
+    return ISC_ESTIMATORS[isc_method](voltage, current, mask, settings)
+
+def _correction_values(settings):
+
+    '''Returns the values of the columns CORRECTION_COLS recording the settings of correct_iv_curves.
+    '''
+
+    return {'corr_min_voltage_fit': float(settings['min_voltage_fit']),
+            'corr_max_voltage_fit': float(settings['max_voltage_fit']),
+            'corr_error_max': float(settings['error_max']),
+            'corr_isc_method': settings.get('isc_method', 'lsq')}
+
+def correct_iv_curves(voltage, current, offsets=None, settings=None):
+
+    '''Batched version of correct_iv_curve. Corrects the improper values of the I/V curves
+    for low voltage. All the curves are fitted at once by a line between min_voltage_fit and
+    max_voltage_fit (see fit_low_voltage_line). For voltages lower than max_voltage_fit the current is
+    replaced by the fitted value where the relative deviation of the measured current to the fit
+    exceeds error_max %.
+
+    Args:
+        voltage (array): padded 2-D array of voltages or concatenated voltages if offsets is not None
+        current (array): padded 2-D array of currents or concatenated currents if offsets is not None
+        offsets (array): n_curves+1 indices of the beginning of the curves for a ragged batch (default: None)
+        settings (dict): {'min_voltage_fit': in V, 'max_voltage_fit': in V, 'error_max': in %,
+                          'isc_method': key of ISC_ESTIMATORS, 'huber_k': Huber threshold in standard deviations,
+                          'ransac_trials': number of RANSAC trials, 'ransac_threshold': RANSAC inlier threshold in %}
+                         (default: GLOBAL['IV_CORRECTION_DICT'])
+
+    Returns:
+        (array): corrected currents with the same layout as current.
+    '''
+
+    # 3rd party imports
+    import numpy as np
+
+    if settings is None: settings = GLOBAL['IV_CORRECTION_DICT']
+    max_voltage_fit = settings['max_voltage_fit']
+    error_max = settings['error_max']
+
+    if offsets is not None:
+        corrected_current = correct_iv_curves(ragged_to_padded(voltage, offsets),
+                                              ragged_to_padded(current, offsets),
+                                              settings=settings)
+        return padded_to_ragged(corrected_current, offsets)
+
+    voltage = np.asarray(voltage, dtype=float)
+    current = np.asarray(current, dtype=float)
+
+    slope, intercept = fit_low_voltage_line(voltage, current, settings=settings)
+    current_fit = slope[:, np.newaxis] * voltage + intercept[:, np.newaxis]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        keep = ~(voltage < max_voltage_fit) | (100 * (current - current_fit) / current < error_max)
+    corrected_current = np.where(keep | np.isnan(voltage), current, current_fit)
+
+    return corrected_current
+
+def compute_corrected_parameters(voltage, current, settings=None):
+
+    '''Computes the corrected short circuit current Isc_corr, which is the first value of the
+    current corrected by correct_iv_curves, and the corrected fill factor
+    Fill Factor_corr = Pmax/(Isc_corr*max(voltage)) of a padded batch of I/V curves.
+
+    Args:
+        voltage (array): padded 2-D array of voltages
+        current (array): padded 2-D array of currents
+        settings (dict): see correct_iv_curves (default: GLOBAL['IV_CORRECTION_DICT'])
+
+    Returns:
+        (dataframe): one row per curve and the columns Isc_corr, Fill Factor_corr and the settings
+        used (columns CORRECTION_COLS).
+    '''
+
+    # 3rd party imports
+    import numpy as np
+    import pandas as pd
+
+    if settings is None: settings = GLOBAL['IV_CORRECTION_DICT']
+
+    voltage = np.asarray(voltage, dtype=float)
+    current = np.asarray(current, dtype=float)
+    corrected_current = correct_iv_curves(voltage, current, settings=settings)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        isc_corr = np.round(corrected_current[:,0],3)
+        fill_factor_corr = np.round(np.nanmax(voltage*current,axis=1)/(corrected_current[:,0]*np.nanmax(voltage,axis=1)),3)
+
+    df_corrected = pd.DataFrame({'Isc_corr': isc_corr, 'Fill Factor_corr': fill_factor_corr})
+    for col, value in _correction_values(settings).items():
+        df_corrected[col] = value
+
+    return df_corrected
+
+def _zero_crossing(current, valid, n_points):
+
+    '''Returns the index of the first sample of each curve with a current lower or equal to zero, the
+    index of the last sample if the current does not cross zero, clipped to at least 1.
+    '''
+
+    # 3rd party imports
+    import numpy as np
+
+    crossing = valid & (current <= 0)
+    idx_cross = np.where(crossing.any(axis=1), np.argmax(crossing, axis=1), n_points - 1)
+
+    return np.clip(idx_cross, 1, None)
+
+def _open_circuit_voltage(voltage, current, valid, n_points):
+
+    '''Returns the open circuit voltage of each curve by linear interpolation at the first zero crossing of
+    the current or by extrapolation out of the two last points of the curve.
+    '''
+
+    # 3rd party imports
+    import numpy as np
+
+    rows = np.arange(voltage.shape[0])
+    idx_cross = _zero_crossing(current, valid, n_points)
+    v0, v1 = voltage[rows, idx_cross - 1], voltage[rows, idx_cross]
+    i0, i1 = current[rows, idx_cross - 1], current[rows, idx_cross]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        voc = v0 - i0 * (v1 - v0) / (i1 - i0)
+
+    return voc
+
+def compute_iv_features(voltage, current, offsets=None, settings=None):
+
+    '''Computes for a batch of I/V curves:
+       - Pmax, Vpm, Ipm: maximum of the power interpolated by the parabola going through the sampled
+         maximum and its two neighbours (Ipm = Pmax/Vpm);
+       - Voc: linear interpolation of the voltage at the first zero crossing of the current. If the current
+         does not cross zero, Voc is extrapolated out of the two last points of the curve;
+       - Isc: current at V = 0 of the line fitted to the curve between min_voltage_fit and max_voltage_fit
+         (see fit_low_voltage_line);
+       - Fill Factor: Pmax/(Isc*Voc).
+
+    Args:
+        voltage (array): padded 2-D array of voltages or concatenated voltages if offsets is not None
+        current (array): padded 2-D array of currents or concatenated currents if offsets is not None
+        offsets (array): n_curves+1 indices of the beginning of the curves for a ragged batch (default: None)
+        settings (dict): see correct_iv_curves (default: GLOBAL['IV_CORRECTION_DICT'])
+
+    Returns:
+        (dataframe): one row per curve and the columns Pmax, Vpm, Ipm, Voc, Isc, Fill Factor.
+    '''
+
+    # 3rd party imports
+    import numpy as np
+    import pandas as pd
+
+    if settings is None: settings = GLOBAL['IV_CORRECTION_DICT']
+
+    if offsets is not None:
+        voltage = ragged_to_padded(voltage, offsets)
+        current = ragged_to_padded(current, offsets)
+
+    voltage = np.asarray(voltage, dtype=float)
+    current = np.asarray(current, dtype=float)
+    rows = np.arange(voltage.shape[0])
+    valid = ~np.isnan(voltage) & ~np.isnan(current)
+    n_points = valid.sum(axis=1)
+
+    # Maximum power point
+    power = np.where(valid, voltage * current, -np.inf)
+    idx_max = np.argmax(power, axis=1)
+    idx_mid = np.clip(idx_max, 1, np.maximum(n_points - 2, 1))
+    x0, x1, x2 = voltage[rows, idx_mid - 1], voltage[rows, idx_mid], voltage[rows, idx_mid + 1]
+    y0, y1, y2 = power[rows, idx_mid - 1], power[rows, idx_mid], power[rows, idx_mid + 1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        denom = (x0 - x1) * (x0 - x2) * (x1 - x2)
+        a = (x2 * (y1 - y0) + x1 * (y0 - y2) + x0 * (y2 - y1)) / denom
+        b = (x2**2 * (y0 - y1) + x1**2 * (y2 - y0) + x0**2 * (y1 - y2)) / denom
+        c = (x1 * x2 * (x1 - x2) * y0 + x2 * x0 * (x2 - x0) * y1 + x0 * x1 * (x0 - x1) * y2) / denom
+        vertex_voltage = -b / (2 * a)
+        vertex_power = c - b**2 / (4 * a)
+    interpolate = (idx_mid == idx_max) & (a < 0) & (vertex_voltage >= x0) & (vertex_voltage <= x2)
+    vpm = np.where(interpolate, vertex_voltage, voltage[rows, idx_max])
+    pmax = np.where(interpolate, vertex_power, power[rows, idx_max])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ipm = pmax / vpm
+
+    # Open circuit voltage
+    voc = _open_circuit_voltage(voltage, current, valid, n_points)
+
+    # Short circuit current
+    _, isc = fit_low_voltage_line(voltage, current, settings=settings)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fill_factor = pmax / (isc * voc)
+
+    df_features = pd.DataFrame({'Pmax': pmax,
+                                'Vpm': vpm,
+                                'Ipm': ipm,
+                                'Voc': voc,
+                                'Isc': isc,
+                                'Fill Factor': fill_factor})
+
+    return df_features
+
+def sgolay1d_kernel(window_size, order):
+
+    '''Computes the kernel of the 1-D Savitzky-Golay filter (see sgolay2d_kernel for the 2-D version).
+
+    Args:
+        window_size (int): number of points of the window
+        order (int): order of the smoothing polynomial
+
+    Returns:
+        (array): jacobian_pseudo_inverse of shape (order+1, window_size). The dot product of its row k
+        with the values of a window gives the coefficient of x**k of the polynomial fitted to the window,
+        x being the index of the point relative to the center of the window.
+    '''
+
+    # 3rd party imports
+    import numpy as np
+
+    if window_size % 2 == 0:
+        raise Exception('Sorry, window_size must be odd')
+    if window_size < order + 1:
+        raise Exception('Sorry, order is too high for the window size')
+
+    half_size = window_size // 2
+    ind = np.arange(-half_size, half_size + 1)
+    jacobian_mat = ind[:, np.newaxis] ** np.arange(order + 1)
+
+    return np.linalg.pinv(jacobian_mat)
+
+def apply_savgol_filter_1d(values, jacobian_pseudo_inverse, derivative=0):
+
+    '''Smoothes, or differentiates with respect to the sample index, all the rows of a padded batch at once
+    with a kernel computed by sgolay1d_kernel.
+
+    Args:
+        values (array): padded 2-D array
+        jacobian_pseudo_inverse (array): kernel computed by sgolay1d_kernel
+        derivative (int): order of the derivative, 0 for the smoothing (default: 0)
+
+    Returns:
+        (array): array of the shape of values, NaN where the window centered on the point is not
+        fully defined.
+    '''
+
+    # Standard library imports
+    import math
+
+    # 3rd party imports
+    import numpy as np
+
+    window_size = jacobian_pseudo_inverse.shape[1]
+    half_size = window_size // 2
+    if derivative >= jacobian_pseudo_inverse.shape[0]:
+        raise Exception('Sorry, the derivative order must be lower or equal to the polynomial order')
+
+    values = np.asarray(values, dtype=float)
+    filtered = np.full(values.shape, np.nan)
+    if values.shape[1] >= window_size:
+        windows = np.lib.stride_tricks.sliding_window_view(values, window_size, axis=1)
+        filtered[:, half_size:values.shape[1] - half_size] = (math.factorial(derivative)
+                                                              * windows @ jacobian_pseudo_inverse[derivative])
+
+    return filtered
+
+def _savgol_slope_at(values, idx_eval, n_points, jacobian_pseudo_inverse):
+
+    '''Evaluates for each row of a padded batch the derivative, with respect to the sample index, of the
+    Savitzky-Golay polynomial at the index idx_eval. The window is shifted inside the curve near its ends
+    and the polynomial is evaluated off-center. NaN is returned for the curves shorter than the window.
+    '''
+
+    # 3rd party imports
+    import numpy as np
+
+    window_size = jacobian_pseudo_inverse.shape[1]
+    half_size = window_size // 2
+    rows = np.arange(values.shape[0])[:, np.newaxis]
+
+    idx_start = np.clip(idx_eval - half_size, 0, np.maximum(n_points - window_size, 0))
+    idx_window = np.minimum(idx_start[:, np.newaxis] + np.arange(window_size), values.shape[1] - 1)
+    coefficients = values[rows, idx_window] @ jacobian_pseudo_inverse.T
+    x = (idx_eval - idx_start - half_size)[:, np.newaxis]
+    powers = np.arange(1, jacobian_pseudo_inverse.shape[0])
+    slope = (powers * coefficients[:, 1:] * x ** (powers - 1.0)).sum(axis=1)
+
+    return np.where(n_points >= window_size, slope, np.nan)
+
+def compute_slope_resistances(voltage, current, offsets=None, settings=None, correction_settings=None):
+
+    '''Computes for a batch of I/V curves the slope resistances:
+       - Rs0 = -dV/dI at the open circuit point (closest sample to Voc);
+       - Rsh0 = -dV/dI at the short circuit point (closest sample to V = 0).
+    The derivatives dV/dk and dI/dk with respect to the sample index k are evaluated with Savitzky-Golay
+    kernels so that the non uniform voltage sampling of the flash is accounted for.
+    dV/dI = (dV/dk)/(dI/dk). Both resistances are computed on the current corrected by correct_iv_curves.
+    The windows are clamped to the largest odd number of samples not exceeding a third of the curve, so
+    that a window never straddles the knee of the curve: the curves shorter than three windows (e.g. the
+    curves of less than 303 samples with the default rsh_window_size of 101) get a value computed on a
+    narrower window; the curves with less than 3*(order+1) samples get NaN.
+
+    Args:
+        voltage (array): padded 2-D array of voltages or concatenated voltages if offsets is not None
+        current (array): padded 2-D array of currents or concatenated currents if offsets is not None
+        offsets (array): n_curves+1 indices of the beginning of the curves for a ragged batch (default: None)
+        settings (dict): {'order': order of the polynomial, 'rs_window_size': window used at Voc,
+                          'rsh_window_size': window used at Isc} (default: GLOBAL['SAVGOL_DICT'])
+        correction_settings (dict): see correct_iv_curves (default: GLOBAL['IV_CORRECTION_DICT'])
+
+    Returns:
+        (dataframe): one row per curve and the columns Rs0, Rsh0 in Ohm.
+    '''
+
+    # 3rd party imports
+    import numpy as np
+    import pandas as pd
+
+    if settings is None: settings = GLOBAL['SAVGOL_DICT']
+
+    if offsets is not None:
+        voltage = ragged_to_padded(voltage, offsets)
+        current = ragged_to_padded(current, offsets)
+
+    voltage = np.asarray(voltage, dtype=float)
+    current = correct_iv_curves(voltage, current, settings=correction_settings)
+    rows = np.arange(voltage.shape[0])
+    valid = ~np.isnan(voltage) & ~np.isnan(current)
+    n_points = valid.sum(axis=1)
+    largest_window = n_points // 3 - (1 - (n_points // 3) % 2) # Largest odd window of each curve
+
+    # Closest samples to the open circuit and to the short circuit points
+    idx_cross = _zero_crossing(current, valid, n_points)
+    closer_before = np.abs(current[rows, idx_cross - 1]) < np.abs(current[rows, idx_cross])
+    idx_voc = np.where(closer_before, idx_cross - 1, idx_cross)
+    idx_isc = np.argmin(np.where(valid, np.abs(voltage), np.inf), axis=1)
+
+    dict_resistance = {}
+    for col, idx_eval, window_size in (('Rs0', idx_voc, settings['rs_window_size']),
+                                       ('Rsh0', idx_isc, settings['rsh_window_size'])):
+        dict_resistance[col] = np.full(voltage.shape[0], np.nan)
+        curve_window = np.minimum(window_size, largest_window)
+        for window in np.unique(curve_window[curve_window >= settings['order'] + 1]):
+            select = curve_window == window
+            jacobian_pseudo_inverse = sgolay1d_kernel(int(window), settings['order'])
+            voltage_slope = _savgol_slope_at(voltage[select], idx_eval[select], n_points[select],
+                                             jacobian_pseudo_inverse)
+            current_slope = _savgol_slope_at(current[select], idx_eval[select], n_points[select],
+                                             jacobian_pseudo_inverse)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                dict_resistance[col][select] = -voltage_slope / current_slope
+
+    return pd.DataFrame(dict_resistance)
+
+def detect_iv_steps(voltage, current, offsets=None, settings=None):
+
+    '''Detects the steps of the I/V curves caused by the bypass diodes of partially shaded or cracked
+    modules. The normalized slope s = -(dI/dV)*Voc/Isc of all the curves is computed at once with
+    Savitzky-Golay derivative kernels (see apply_savgol_filter_1d). A step is a sample where:
+       - s is the maximum of s over the window_size samples centered on the sample;
+       - s exceeds threshold;
+       - s falls below drop_fraction times its value within the window_size following samples, which
+         discards the monotonous rise of the slope toward Voc;
+       - the voltage lies between 0 and voc_fraction*Voc.
+
+    Args:
+        voltage (array): padded 2-D array of voltages or concatenated voltages if offsets is not None
+        current (array): padded 2-D array of currents or concatenated currents if offsets is not None
+        offsets (array): n_curves+1 indices of the beginning of the curves for a ragged batch (default: None)
+        settings (dict): {'window_size': window of the kernels, 'order': order of the polynomial,
+                          'threshold': minimum normalized slope, 'drop_fraction': see above,
+                          'voc_fraction': see above} (default: GLOBAL['STEP_DETECTION_DICT'])
+
+    Returns:
+        (dataframe): one row per curve and the columns step_count and step_voltages, the ';' separated
+        voltages in V of the steps.
+    '''
+
+    # 3rd party imports
+    import numpy as np
+    import pandas as pd
+
+    if settings is None: settings = GLOBAL['STEP_DETECTION_DICT']
+
+    if offsets is not None:
+        voltage = ragged_to_padded(voltage, offsets)
+        current = ragged_to_padded(current, offsets)
+
+    voltage = np.asarray(voltage, dtype=float)
+    current = np.asarray(current, dtype=float)
+    rows = np.arange(voltage.shape[0])
+    valid = ~np.isnan(voltage) & ~np.isnan(current)
+    n_points = valid.sum(axis=1)
+    window_size = settings['window_size']
+    half_size = window_size // 2
+
+    voc = _open_circuit_voltage(voltage, current, valid, n_points)
+    isc = current[rows, np.argmin(np.where(valid, np.abs(voltage), np.inf), axis=1)]
+
+    jacobian_pseudo_inverse = sgolay1d_kernel(window_size, settings['order'])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = (-apply_savgol_filter_1d(current, jacobian_pseudo_inverse, derivative=1)
+                 / apply_savgol_filter_1d(voltage, jacobian_pseudo_inverse, derivative=1)
+                 * (voc / isc)[:, np.newaxis])
+    defined = ~np.isnan(slope)
+
+    # Maximum over the centered window and minimum over the following window
+    padded = np.pad(np.where(defined, slope, -np.inf), ((0, 0), (half_size, half_size)), constant_values=-np.inf)
+    local_max = np.lib.stride_tricks.sliding_window_view(padded, window_size, axis=1).max(axis=2)
+    padded = np.pad(np.where(defined, slope, np.inf), ((0, 0), (0, window_size)), constant_values=np.inf)
+    following_min = np.lib.stride_tricks.sliding_window_view(padded[:, 1:], window_size, axis=1).min(axis=2)
+    following_min = following_min[:, :slope.shape[1]]
+
+    with np.errstate(invalid='ignore'):
+        step = (defined
+                & (slope == local_max)
+                & (slope > settings['threshold'])
+                & (following_min < settings['drop_fraction'] * slope)
+                & (voltage > 0)
+                & (voltage < settings['voc_fraction'] * voc[:, np.newaxis]))
+
+    step_count = step.sum(axis=1)
+    step_rows, step_cols = np.nonzero(step)
+    list_step_voltages = np.split(voltage[step_rows, step_cols], np.cumsum(step_count)[:-1])
+    df_steps = pd.DataFrame({'step_count': step_count.astype(int),
+                             'step_voltages': [';'.join([f'{x:.2f}' for x in step_voltages])
+                                               for step_voltages in list_step_voltages]})
+
+    return df_steps
+
+def _lambertw_exp(x, n_iter=30):
+
+    '''Computes W(exp(x)), where W is the principal branch of the Lambert function, without
+    evaluating exp(x) which overflows for the large arguments met with PV modules.
+    The equation u + exp(u) = x, with u = log(W(exp(x))), is solved by Newton iterations.
+    '''
+
+    # 3rd party imports
+    import numpy as np
+
+    with np.errstate(invalid='ignore', over='ignore'):
+        u = np.log(np.logaddexp(0, x))
+        for _ in range(n_iter):
+            exp_u = np.exp(u)
+            delta = (u + exp_u - x) / (1 + exp_u)
+            u = u - delta
+            if not np.max(np.abs(np.nan_to_num(delta)), initial=0) > 1e-14:
+                break
+
+    return np.exp(u)
+
+def single_diode_current(voltage, iph, i0, n, rs, rsh, cells_in_series=None, temperature=None):
+
+    '''Computes the current of the single diode model
+        I = Iph - I0*(exp((V + I*Rs)/(n*Ns*Vt)) - 1) - (V + I*Rs)/Rsh
+    using its explicit Lambert W form
+        I = (Rsh*(Iph + I0) - V)/(Rs + Rsh) - (a/Rs)*W(theta)   with a = n*Ns*Vt
+        theta = Rs*Rsh*I0/(a*(Rs + Rsh)) * exp(Rsh*(Rs*(Iph + I0) + V)/(a*(Rs + Rsh)))
+
+    Args:
+        voltage (array): voltages in V
+        iph, i0, n, rs, rsh (arrays): photo current (A), saturation current (A), ideality factor,
+            series resistance (Ohm) and shunt resistance (Ohm) broadcastable against voltage
+        cells_in_series (int): number of cells in series Ns (default: GLOBAL['SINGLE_DIODE_DICT']['cells_in_series'])
+        temperature (float): cells temperature in °C (default: GLOBAL['SINGLE_DIODE_DICT']['temperature'])
+
+    Returns:
+        (array): currents in A.
+    '''
+
+    # 3rd party imports
+    import numpy as np
+
+    if cells_in_series is None: cells_in_series = GLOBAL['SINGLE_DIODE_DICT']['cells_in_series']
+    if temperature is None: temperature = GLOBAL['SINGLE_DIODE_DICT']['temperature']
+
+    boltzmann = 1.380649e-23          # in J/K
+    elementary_charge = 1.602176634e-19  # in C
+    thermal_voltage = boltzmann * (temperature + 273.15) / elementary_charge
+
+    a = n * cells_in_series * thermal_voltage
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        x = np.log(rs * rsh * i0 / (a * (rs + rsh))) + rsh * (rs * (iph + i0) + voltage) / (a * (rs + rsh))
+        current = (rsh * (iph + i0) - voltage) / (rs + rsh) - (a / rs) * _lambertw_exp(x)
+
+    return current
+
+def fit_single_diode(voltage, current, offsets=None, cells_in_series=None, temperature=None,
+                     workers=None, chunk_size=None):
+
+    '''Fits the single diode model (see single_diode_current) to a batch of I/V curves by
+    Levenberg-Marquardt iterations run simultaneously on all the curves. The low voltage
+    currents are corrected beforehand with correct_iv_curves and only the points with V >= 0
+    are fitted. The batch is split in chunks of chunk_size curves processed in parallel by
+    workers processes if workers > 1. The worker processes are spawned on Windows and macOS:
+    a script calling fit_single_diode with workers > 1 must then be guarded by
+    if __name__ == '__main__':.
+
+    Args:
+        voltage (array): padded 2-D array of voltages or concatenated voltages if offsets is not None
+        current (array): padded 2-D array of currents or concatenated currents if offsets is not None
+        offsets (array): n_curves+1 indices of the beginning of the curves for a ragged batch (default: None)
+        cells_in_series (int): number of cells in series (default: GLOBAL['SINGLE_DIODE_DICT']['cells_in_series'])
+        temperature (float): cells temperature in °C (default: GLOBAL['SINGLE_DIODE_DICT']['temperature'])
+        workers (int): number of worker processes, 1 for a serial processing
+                       (default: GLOBAL['SINGLE_DIODE_DICT']['workers'], 1)
+        chunk_size (int): number of curves fitted by a worker in one go (default: GLOBAL['SINGLE_DIODE_DICT']['chunk_size'])
+
+    Returns:
+        (dataframe): one row per curve and the columns Iph, I0, n, Rs, Rsh and rmse (root mean square
+        of the current residuals in A).
+    '''
+
+    # Standard library imports
+    import functools
+    from concurrent.futures import ProcessPoolExecutor
+
+    # 3rd party imports
+    import numpy as np
+    import pandas as pd
+
+    SINGLE_DIODE_DICT = GLOBAL['SINGLE_DIODE_DICT']
+    if cells_in_series is None: cells_in_series = SINGLE_DIODE_DICT['cells_in_series']
+    if temperature is None: temperature = SINGLE_DIODE_DICT['temperature']
+    if workers is None: workers = SINGLE_DIODE_DICT['workers']
+    if chunk_size is None: chunk_size = SINGLE_DIODE_DICT['chunk_size']
+
+    if offsets is not None:
+        voltage = ragged_to_padded(voltage, offsets)
+        current = ragged_to_padded(current, offsets)
+    voltage = np.asarray(voltage, dtype=float)
+    current = np.asarray(current, dtype=float)
+
+    fit_chunk = functools.partial(_fit_single_diode_chunk,
+                                  cells_in_series=cells_in_series,
+                                  temperature=temperature,
+                                  max_iter=SINGLE_DIODE_DICT['max_iter'])
+    list_slices = [slice(idx, idx + chunk_size) for idx in range(0, len(voltage), chunk_size)]
+    if workers > 1 and len(list_slices) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(list_slices))) as executor:
+            list_params = list(executor.map(fit_chunk,
+                                            [voltage[x] for x in list_slices],
+                                            [current[x] for x in list_slices]))
+    else:
+        list_params = [fit_chunk(voltage[x], current[x]) for x in list_slices]
+
+    params = np.concatenate(list_params) if list_params else np.empty((0, 6))
+    df_params = pd.DataFrame(params, columns=['Iph', 'I0', 'n', 'Rs', 'Rsh', 'rmse'])
+
+    return df_params
+
+def _fit_single_diode_chunk(voltage, current, cells_in_series, temperature, max_iter):
+
+    '''Levenberg-Marquardt fit of the single diode model to the padded batch of curves (voltage, current).
+    The parameters p = (Iph, log(I0), n, log(Rs), log(Rsh)) of all the curves are updated at once:
+    the jacobians are computed by finite differences and the (n_curves, 5, 5) damped normal
+    equations are solved by a single call to np.linalg.solve.
+
+    Returns:
+        (array): array of shape (n_curves, 6) of Iph, I0, n, Rs, Rsh, rmse.
+    '''
+
+    # 3rd party imports
+    import numpy as np
+
+    n_params = 5
+    current = correct_iv_curves(voltage, current)
+    mask = ~np.isnan(voltage) & ~np.isnan(current) & (voltage >= 0)
+    voltage = np.where(mask, voltage, 0)
+    current = np.where(mask, current, 0)
+    n_points = mask.sum(axis=1)
+
+    def residuals(p, rows):
+        with np.errstate(over='ignore'):
+            model = single_diode_current(voltage[rows],
+                                         p[:, 0:1],
+                                         np.exp(p[:, 1:2]),
+                                         p[:, 2:3],
+                                         np.exp(p[:, 3:4]),
+                                         np.exp(p[:, 4:5]),
+                                         cells_in_series=cells_in_series,
+                                         temperature=temperature)
+        return np.where(mask[rows], model - current[rows], 0)
+
+    def cost(res):
+        with np.errstate(invalid='ignore', over='ignore'):
+            cost = (res**2).sum(axis=1)
+        return np.where(np.isfinite(cost), cost, np.inf)
+
+    # Initial guess out of Isc, Voc and of the slopes of the curve at Isc and at Voc
+    thermal_voltage = 1.380649e-23 * (temperature + 273.15) / 1.602176634e-19
+    n_init = 1.2
+    a = n_init * cells_in_series * thermal_voltage
+    features = compute_iv_features(np.where(mask, voltage, np.nan), np.where(mask, current, np.nan))
+    isc = features['Isc'].to_numpy()
+    voc = features['Voc'].to_numpy()
+    slope_sc, _ = _linear_fit(voltage, current, mask & (voltage < 0.5 * voc[:, np.newaxis]))
+    slope_oc, _ = _linear_fit(voltage, current, mask & (voltage > 0.9 * voc[:, np.newaxis]))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rsh = np.clip(-1 / slope_sc, 10 * voc / isc, 1e4 * voc / isc)
+        rs = np.clip(-1 / slope_oc - a / isc, 1e-3 * voc / isc, 0.1 * voc / isc)
+        log_i0 = np.log(np.clip(isc - voc / rsh, 1e-3 * isc, None)) - voc / a
+    p = np.stack([isc, log_i0, np.full_like(isc, n_init), np.log(rs), np.log(rsh)], axis=1)
+    p = np.where(np.isfinite(p), p, 0)
+
+    # Only the curves which fit has not yet converged are iterated
+    active = np.arange(len(p))
+    res = residuals(p, active)
+    current_cost = cost(res)
+    damping = np.full(len(p), 1e-3)
+    for _ in range(max_iter):
+        if not len(active):
+            break
+        p_act = p[active]
+        res_act = res[active]
+        step = 1e-6 * np.maximum(np.abs(p_act), 1)
+        jacobian = np.empty(res_act.shape + (n_params,))
+        for idx in range(n_params):
+            p_step = p_act.copy()
+            p_step[:, idx] += step[:, idx]
+            jacobian[:, :, idx] = (residuals(p_step, active) - res_act) / step[:, idx:idx+1]
+        jacobian = np.where(np.isfinite(jacobian), jacobian, 0)
+        
+        jtj = np.einsum('bni,bnj->bij', jacobian, jacobian)
+        gradient = np.einsum('bni,bn->bi', jacobian, res_act)
+        diag = np.einsum('bii->bi', jtj)
+        lhs = jtj + (damping[active, np.newaxis] * diag + 1e-12)[:, :, np.newaxis] * np.eye(n_params)
+        delta = np.linalg.solve(lhs, -gradient[:, :, np.newaxis])[:, :, 0]
+        
+        p_new = p_act + np.where(np.isfinite(delta), delta, 0)
+        res_new = residuals(p_new, active)
+        new_cost = cost(res_new)
+        improved = new_cost < current_cost[active]
+        converged = improved & (current_cost[active] - new_cost <= 1e-10 * current_cost[active])
+        
+        p[active[improved]] = p_new[improved]
+        res[active[improved]] = res_new[improved]
+        current_cost[active[improved]] = new_cost[improved]
+        damping[active] = np.where(improved, damping[active] / 3, damping[active] * 4)
+        active = active[~converged & (damping[active] < 1e10)]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rmse = np.sqrt(current_cost / n_points)
+
+    return np.stack([p[:, 0], np.exp(p[:, 1]), p[:, 2], np.exp(p[:, 3]), np.exp(p[:, 4]), rmse], axis=1)
+
+def resample_iv_curves(voltage, current, grid, offsets=None, voltage_scale=None):
+
+    '''Interpolates linearly a batch of I/V curves on a common voltage grid in one vectorised pass.
+    The curves are concatenated after shifting the voltages of the curve k by k*span, where span
+    exceeds the voltage range of the batch, so that a single np.searchsorted locates the grid
+    points of all the curves at once.
+
+    Args:
+        voltage (array): padded 2-D array of voltages or concatenated voltages if offsets is not None
+        current (array): padded 2-D array of currents or concatenated currents if offsets is not None
+        grid (array): 1-D voltage grid
+        offsets (array): n_curves+1 indices of the beginning of the curves for a ragged batch (default: None)
+        voltage_scale (array): per curve scale of the grid; the curve k is interpolated at grid*voltage_scale[k]
+            (ex: Voc for a grid in V/Voc units) (default: None, no scaling)
+
+    Returns:
+        (array): currents of shape (n_curves, len(grid)). The grid points outside the voltage
+        range of a curve are set to NaN.
+    '''
+
+    # 3rd party imports
+    import numpy as np
+
+    if offsets is not None:
+        voltage = ragged_to_padded(voltage, offsets)
+        current = ragged_to_padded(current, offsets)
+    voltage = np.asarray(voltage, dtype=float)
+    current = np.asarray(current, dtype=float)
+    grid = np.asarray(grid, dtype=float)
+
+    n_curves = voltage.shape[0]
+    if n_curves == 0:
+        return np.empty((0, len(grid)))
+    rows = np.arange(n_curves)
+    x_grid = np.broadcast_to(grid, (n_curves, len(grid)))
+    if voltage_scale is not None:
+        x_grid = x_grid * np.asarray(voltage_scale, dtype=float)[:, np.newaxis]
+
+    valid = ~np.isnan(voltage) & ~np.isnan(current)
+    n_points = valid.sum(axis=1)
+    if not n_points.any():
+        return np.full((n_curves, len(grid)), np.nan)
+    start = np.concatenate([[0], np.cumsum(n_points)[:-1]])
+    stop = start + n_points
+
+    span = np.nanmax(np.abs(voltage)) + np.nanmax(np.abs(x_grid)) + 1
+    flat_x = (voltage + span * 2 * rows[:, np.newaxis])[valid]
+    flat_y = current[valid]
+    x_query = x_grid + span * 2 * rows[:, np.newaxis]
+
+    idx = np.searchsorted(flat_x, x_query)
+    idx = np.clip(idx, start[:, np.newaxis] + 1, np.maximum(stop[:, np.newaxis] - 1, start[:, np.newaxis] + 1))
+    idx = np.minimum(idx, len(flat_x) - 1)
+    x0, x1 = flat_x[idx - 1], flat_x[idx]
+    y0, y1 = flat_y[idx - 1], flat_y[idx]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        current_grid = y0 + (x_query - x0) * (y1 - y0) / (x1 - x0)
+
+    first = flat_x[np.minimum(start, len(flat_x) - 1)][:, np.newaxis]
+    last = flat_x[np.maximum(stop - 1, 0)][:, np.newaxis]
+    outside = (x_query < first) | (x_query > last) | (n_points[:, np.newaxis] < 2) | np.isnan(x_query)
+    current_grid[outside] = np.nan
+
+    return current_grid
+
+def compute_repeatability(voltage_sweeps, current_sweeps, thresholds=None):
+
+    '''Computes the repeatability of the successive sweeps (IV0, IV1, IV2) of a batch of flashes:
+       - Pmax_spread, Isc_spread, Voc_spread: 100*(max - min)/mean of the parameter over the sweeps
+         (see compute_iv_features);
+       - IV_max_deviation: maximum over the sweeps and over the voltages between 0 and Voc of IV0 of
+         100*|I(sweep) - I(IV0)|/Isc(IV0), the curves being resampled on a common V/Voc grid;
+       - noisy_flash: 1 if one of the metrics exceeds its threshold, 0 otherwise.
+
+    Args:
+        voltage_sweeps (list of arrays): padded 2-D arrays of voltages of each sweep, IV0 first
+        current_sweeps (list of arrays): padded 2-D arrays of currents of each sweep, IV0 first
+        thresholds (dict): {metric: threshold in %} (default: GLOBAL['REPEATABILITY_THRESHOLD_DICT'])
+
+    Returns:
+        (dataframe): one row per flash and the columns Pmax_spread, Isc_spread, Voc_spread,
+        IV_max_deviation and noisy_flash.
+    '''
+
+    # 3rd party imports
+    import numpy as np
+    import pandas as pd
+
+    if thresholds is None: thresholds = GLOBAL['REPEATABILITY_THRESHOLD_DICT']
+
+    list_features = [compute_iv_features(voltage, current)
+                     for voltage, current in zip(voltage_sweeps, current_sweeps)]
+
+    df_repeatability = pd.DataFrame(index=list_features[0].index)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for param in ['Pmax', 'Isc', 'Voc']:
+            values = np.stack([features[param].to_numpy() for features in list_features])
+            df_repeatability[f'{param}_spread'] = 100 * (values.max(axis=0) - values.min(axis=0)) / values.mean(axis=0)
+
+        grid = np.linspace(0, 1, 101)
+        voc_ref = list_features[0]['Voc'].to_numpy()
+        isc_ref = list_features[0]['Isc'].to_numpy()
+        list_current_grid = [resample_iv_curves(voltage, current, grid, voltage_scale=voc_ref)
+                             for voltage, current in zip(voltage_sweeps, current_sweeps)]
+        deviation = np.stack([np.abs(current_grid - list_current_grid[0]) for current_grid in list_current_grid[1:]])
+        deviation = np.where(np.isnan(deviation), -np.inf, deviation).max(axis=(0, 2))
+        df_repeatability['IV_max_deviation'] = np.where(np.isinf(deviation), np.nan, 100 * deviation / isc_ref)
+
+    noisy = np.zeros(len(df_repeatability), dtype=bool)
+    for metric, threshold in thresholds.items():
+        noisy |= (df_repeatability[metric] > threshold).to_numpy()
+    df_repeatability['noisy_flash'] = noisy.astype(int)
+
+    return df_repeatability
+
+def correct_iec60891(voltage, current, irradiance, target_irradiance, temperature=None, target_temperature=None,
+                     coefficients=None):
+
+    '''Translates a batch of I/V curves to target irradiance and temperature conditions with the
+    procedure 1 of the IEC 60891 standard:
+        I2 = I1 + Isc1*(G2/G1 - 1) + alpha*Isc1*(T2 - T1)
+        V2 = V1 - Rs*(I2 - I1) - kappa*I2*(T2 - T1) + beta*Voc1*(T2 - T1)
+    where Isc1 and Voc1 are computed out of the measured curves by compute_iv_features.
+
+    Args:
+        voltage (array): padded 2-D array of voltages
+        current (array): padded 2-D array of currents
+        irradiance (array): measured irradiance G1 of each curve in W/m2
+        target_irradiance (array or float): target irradiance G2 in W/m2
+        temperature (array or float): measured temperature T1 in °C (default: GLOBAL['IEC60891_DICT']['measured_temperature'])
+        target_temperature (array or float): target temperature T2 in °C (default: GLOBAL['IEC60891_DICT']['target_temperature'])
+        coefficients (dict): {'alpha': relative temperature coefficient of Isc in 1/K,
+                              'beta': relative temperature coefficient of Voc in 1/K,
+                              'rs': internal series resistance in Ohm,
+                              'kappa': curve correction factor in Ohm/K} (default: GLOBAL['IEC60891_DICT'])
+
+    Returns:
+        (tuple of arrays): (voltage, current) padded 2-D arrays of the corrected curves.
+    '''
+
+    # 3rd party imports
+    import numpy as np
+
+    IEC60891_DICT = GLOBAL['IEC60891_DICT']
+    if temperature is None: temperature = IEC60891_DICT['measured_temperature']
+    if target_temperature is None: target_temperature = IEC60891_DICT['target_temperature']
+    if coefficients is None: coefficients = IEC60891_DICT
+
+    voltage = np.asarray(voltage, dtype=float)
+    current = np.asarray(current, dtype=float)
+
+    def column(x):
+        return np.broadcast_to(np.asarray(x, dtype=float), (voltage.shape[0],))[:, np.newaxis]
+
+    features = compute_iv_features(voltage, current)
+    isc = column(features['Isc'].to_numpy())
+    voc = column(features['Voc'].to_numpy())
+    delta_temperature = column(target_temperature) - column(temperature)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        current_corrected = current + isc * (column(target_irradiance) / column(irradiance) - 1) \
+                                    + coefficients['alpha'] * isc * delta_temperature
+    voltage_corrected = voltage - coefficients['rs'] * (current_corrected - current) \
+                                - coefficients['kappa'] * current_corrected * delta_temperature \
+                                + coefficients['beta'] * voc * delta_temperature
+
+    return voltage_corrected, current_corrected
+
+def compute_qc_flags(voltage, current, header, invalid_counts=None, noisy_flash=None, thresholds=None):
+
+    '''Computes the quality flags of a batch of I/V curves as a bitmask of the QC_* bits:
+       - QC_NON_MONOTONIC_VOLTAGE: the voltage is not strictly increasing;
+       - QC_INVALID_VALUES: invalid_counts (number of -1.#IND or blank values of the data blocks of the
+         file) is not null or a Pmax, Isc or Voc header value is not numeric;
+       - QC_PLATEAU: the maximum deviation in % of Isc of the current to its linear fit between 0 and Voc/2
+         exceeds thresholds['plateau_max_deviation'];
+       - QC_HEADER_MISMATCH: the relative difference in % between the header and the curve (see compute_iv_features)
+         Pmax, Isc or Voc exceeds thresholds['header_tolerance'];
+       - QC_FEW_SAMPLES: the number of points is lower than thresholds['min_samples'];
+       - QC_NOISY_FLASH: noisy_flash (see compute_repeatability) is not null.
+
+    Args:
+        voltage (array): padded 2-D array of voltages
+        current (array): padded 2-D array of currents
+        header (dataframe): header values with at least the columns Pmax, Isc and Voc, one row per curve
+        invalid_counts (array): number of invalid values of each file (default: None, not checked)
+        noisy_flash (array): noisy flash indicators (default: None, not checked)
+        thresholds (dict): see above (default: GLOBAL['QC_DICT'])
+
+    Returns:
+        (array): integer array of the flags, 0 for a curve which passes all the checks.
+    '''
+
+    # 3rd party imports
+    import numpy as np
+
+    if thresholds is None: thresholds = GLOBAL['QC_DICT']
+
+    voltage = np.asarray(voltage, dtype=float)
+    current = np.asarray(current, dtype=float)
+    valid = ~np.isnan(voltage) & ~np.isnan(current)
+    n_points = valid.sum(axis=1)
+    qc_flags = np.zeros(voltage.shape[0], dtype=np.int64)
+
+    with np.errstate(invalid='ignore'):
+        non_monotonic = ((np.diff(voltage, axis=1) <= 0) & valid[:, 1:]).any(axis=1)
+    qc_flags |= np.where(non_monotonic, QC_NON_MONOTONIC_VOLTAGE, 0)
+
+    if invalid_counts is not None:
+        qc_flags |= np.where(np.asarray(invalid_counts) > 0, QC_INVALID_VALUES, 0)
+
+    features = compute_iv_features(voltage, current)
+    isc = features['Isc'].to_numpy()[:, np.newaxis]
+    voc = features['Voc'].to_numpy()[:, np.newaxis]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        plateau = valid & (voltage >= 0) & (voltage <= voc / 2)
+        slope, intercept = _linear_fit(voltage, current, plateau)
+        deviation = np.abs(current - slope[:, np.newaxis] * voltage - intercept[:, np.newaxis])
+        deviation = np.where(plateau, deviation, -np.inf).max(axis=1)
+        bad_plateau = ~(100 * deviation / isc[:, 0] <= thresholds['plateau_max_deviation'])
+    qc_flags |= np.where(bad_plateau, QC_PLATEAU, 0)
+
+    mismatch = np.zeros(len(qc_flags), dtype=bool)
+    invalid_header = np.zeros(len(qc_flags), dtype=bool)
+    for param in ['Pmax', 'Isc', 'Voc']:
+        header_value = np.full(len(qc_flags), np.nan)
+        invalid = np.zeros(len(qc_flags), dtype=bool)
+        for idx, value in enumerate(header[param]):
+            try:
+                header_value[idx] = float(value)
+            except (TypeError, ValueError): # Empty or text header value
+                invalid[idx] = True
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rel_diff = 100 * np.abs(features[param].to_numpy() - header_value) / np.abs(header_value)
+        mismatch |= ~(rel_diff <= thresholds['header_tolerance']) & ~invalid
+        invalid_header |= invalid
+    qc_flags |= np.where(invalid_header, QC_INVALID_VALUES, 0)
+    qc_flags |= np.where(mismatch, QC_HEADER_MISMATCH, 0)
+
+    qc_flags |= np.where(n_points < thresholds['min_samples'], QC_FEW_SAMPLES, 0)
+
+    if noisy_flash is not None:
+        qc_flags |= np.where(np.asarray(noisy_flash) > 0, QC_NOISY_FLASH, 0)
+
+    return qc_flags
@@ -8,11 +8,15 @@ __all_ =['construct_x_y',
 from .config import GLOBAL
 from .PVcharacterization_GUI import (select_items,
                                      select_files)
-from .PVcharacterization_flashtest import (correct_iv_curve,
+from .PVcharacterization_flashtest import (compute_relative_diff,
+                                           correct_iv_curve,
                                            parse_filename,
+                                           read_degradation_table,
                                            read_flashtest_file,)
 
-from .PVcharacterization_database import sieve_files
+from .PVcharacterization_database import (_database_path,
+                                          _table_exists,
+                                          sieve_files,)
 
 def _plot_params(params,
                  list_modules_type,
@@ -20,7 +24,8 @@ def _plot_params(params,
                  plot_params_dict,
                  list_diff = [],
                  dic_trt_meaning=None,
-                 long_label=False,):
+                 long_label=False,
+                 working_dir=None,):
     
     '''Plots for different modules and for different parameters:
        - the relative  evolution (in %) of the parameters vs irradiance for treatment differences if diff=True
@@ -43,6 +48,9 @@ def _plot_params(params,
                                   treatment tuple[0] and tuple[1] are plotted.
        long_label (bool): if true long labels such moduletype_irradiance are plotted
                           if false short labels moduletype is plotted instead
+       working_dir (str): folder of the database holding the degradation table read when list_diff
+                          is not empty. If None, or if the table does not match df_meta, the relative
+                          variations are computed out of df_meta (default: None)
 
     '''
 
@@ -74,9 +82,14 @@ def _plot_params(params,
         list_trt_diff = list_trt
         dic_ax = {t:i for i,t in enumerate(list_trt)}
     
+    # Relative variations read once for all the modules, parameters and treatment differences
+    df_diff = _read_diff(working_dir, df_meta, list_modules_type, params, list_diff) if diff else None
+    
     #  Set ordinates dynamic of the plots (enlarge the irradiance dynamic)
     dic_ylim = _set_ymin_ymax_param(df_meta,params, list_modules_type,list_trt_diff,diff,
-                                    limit_type= plot_params_dict['y_limit_type'])
+                                    limit_type= plot_params_dict['y_limit_type'],
+                                    df_diff=df_diff)
+    if diff: df_diff = _index_diff(df_diff)
             
     #  Set abcissa dynamic of the plots (enlarge the irradiance dynamic)
     (irr_min, irr_max) = _set_xmin_xmax(list_irr,irr_add_nbr=plot_params_dict['irr_add_nbr'])
@@ -103,7 +116,7 @@ def _plot_params(params,
         for idx_param, param in enumerate(params): # Loop over the parameters
             for num_trt,trt in enumerate(list_trt_diff): # Loop over the treatmentS
                 idx_trt = dic_ax[trt]
-                x,y = construct_x_y(df_meta,module_type,trt,param,diff)
+                x,y = construct_x_y(df_meta,module_type,trt,param,diff,df_diff=df_diff)
                 for idx_irr,x_y in enumerate(zip(x,y)):
                     
                     if long_label:
@@ -187,7 +200,7 @@ def _plot_params(params,
         fig.suptitle(plot_params_dict['suptitle'], fontsize=plot_params_dict['suptitle_font_size'])
     plt.show()
     
-def construct_x_y(df_meta,module_type,treatment,param,diff):
+def construct_x_y(df_meta,module_type,treatment,param,diff,df_diff=None):
     
     '''Construct for the module type 'module_type', the parameter 'parameter' and the treatment 'treatment' the 
     list of abscissa x and ordonates y where y(x) corresponds to:
@@ -203,6 +216,8 @@ def construct_x_y(df_meta,module_type,treatment,param,diff):
        param (str): the parameter
        diff (bool): TRUE we work with parameter differences
                     FALSE we work with parameters
+       df_diff (dataframe): precomputed relative variations read by read_degradation_table, 
+                            optionally indexed by _index_diff (default: None)
        
     Returns:
        (x,y) 
@@ -211,7 +226,17 @@ def construct_x_y(df_meta,module_type,treatment,param,diff):
     
     import numpy as np
     
-    if not diff:
+    if diff and df_diff is not None:
+        df_diff = _index_diff(df_diff)
+        key = (module_type, param, treatment[0], treatment[1])
+        if key in df_diff.index:
+            dg = df_diff.loc[[key]].sort_values('irradiance')
+            x = dg['irradiance'].tolist()
+            y = dg['rel_diff'].to_numpy()
+        else:
+            x = []
+            y = []
+    elif not diff:
         df_meta_cp = df_meta.query("module_type==@module_type & treatment==@treatment")
         y = df_meta_cp[param].tolist()
         x = df_meta_cp['irradiance'].astype(float).tolist()
@@ -229,20 +254,106 @@ def construct_x_y(df_meta,module_type,treatment,param,diff):
         
     return (x,y)
     
-def _set_ymin_ymax_param(df_meta, params, list_modules_type, list_trt_diff, diff, limit_type=None):
+def _read_diff(working_dir, df_meta, list_modules_type, params, list_diff):
+
+    '''Returns the relative variations of the parameters params between the treatments of list_diff for
+    the modules list_modules_type of df_meta. They are read out of the degradation table of the database
+    of working_dir (see read_degradation_table) when the table exists and matches df_meta (see 
+    _diff_matches_meta). Otherwise, or if working_dir is None, they are computed out of df_meta by
+    compute_relative_diff.
+    '''
+    
+    DATA_BASE_TABLE_DIFF = GLOBAL['DATA_BASE_TABLE_DIFF']
+    
+    df_meta = df_meta[df_meta['module_type'].isin(list_modules_type)]
+    
+    if (working_dir is not None 
+        and _database_path(working_dir).exists()
+        and _table_exists(working_dir, DATA_BASE_TABLE_DIFF)):
+        df_diff = read_degradation_table(working_dir, list_modules_type, list_params=params, list_diff=list_diff)
+        df_diff = df_diff[df_diff['irradiance'].astype(float).isin(df_meta['irradiance'].astype(float))]
+        if _diff_matches_meta(df_diff, df_meta, params, list_diff):
+            return df_diff
     
-    '''Build a dict keyed by the parameters and which values are list [ymin, ymax] 
+    return compute_relative_diff(df_meta, list_params=params, list_diff=list_diff)
+    
+def _diff_matches_meta(df_diff, df_meta, params, list_diff):
+
+    '''Checks that the relative variations df_diff read out of the degradation table were computed out
+    of the parameters values of df_meta: df_diff must hold one row per module type, irradiance, parameter
+    and couple of treatments of df_meta, with the same values value_end and value_ref.
     '''
     
+    # 3rd party imports
+    import numpy as np
+    import pandas as pd
+    
+    keys = ['module_type', 'irradiance', 'parameter']
+    df_long = df_meta.melt(id_vars=['module_type', 'irradiance', 'treatment'],
+                           value_vars=params,
+                           var_name='parameter',
+                           value_name='value')
+    df_long['irradiance'] = df_long['irradiance'].astype(float)
+    df_pairs = pd.DataFrame(list(list_diff), columns=['treatment_end', 'treatment_ref'])
+    df_expected = (df_long.rename(columns={'treatment': 'treatment_end', 'value': 'meta_end'})
+                          .merge(df_pairs, on='treatment_end')
+                          .merge(df_long.rename(columns={'treatment': 'treatment_ref', 'value': 'meta_ref'}),
+                                 on=keys + ['treatment_ref']))
+    
+    df_diff = df_diff.assign(irradiance=df_diff['irradiance'].astype(float))
+    df_check = df_expected.merge(df_diff, 
+                                 on=keys + ['treatment_end', 'treatment_ref'], 
+                                 how='outer',
+                                 indicator=True)
+    if len(df_check) != len(df_expected) or (df_check['_merge'] != 'both').any():
+        return False
+    
+    try:
+        return (np.allclose(df_check['meta_end'].astype(float), df_check['value_end'].astype(float), equal_nan=True)
+                and np.allclose(df_check['meta_ref'].astype(float), df_check['value_ref'].astype(float), equal_nan=True))
+    except (TypeError, ValueError):
+        return False
+    
+def _index_diff(df_diff):
+
+    '''Indexes the dataframe built by compute_relative_diff or read_degradation_table by 
+    (module_type, parameter, treatment_end, treatment_ref) for fast lookups.
+    '''
+    
+    keys = ['module_type', 'parameter', 'treatment_end', 'treatment_ref']
+    if list(df_diff.index.names) == keys:
+        return df_diff
+    
+    return df_diff.set_index(keys).sort_index()
+    
+def _set_ymin_ymax_param(df_meta, params, list_modules_type, list_trt_diff, diff, limit_type=None, df_diff=None):
+    
+    '''Build a dict keyed by the parameters and which values are list [ymin, ymax]. If diff is True
+    and df_diff is not None the limits are taken out of the relative variations df_diff (see _read_diff),
+    otherwise they are computed out of df_meta.
+    '''
+    
+    # 3rd party imports
+    import pandas as pd
+    
     min_max_param = {}
     
-    for param in params: # Loop over the parameters
-        val = []
-        for  module_type in list_modules_type: # Loop on the modules type
-            for trt in list_trt_diff: # Loop over the treatmentS
-                _,y = construct_x_y(df_meta,module_type,trt,param,diff)
-                val.extend(y)
-        min_max_param [param] =[ min(val),max(val)] 
+    if diff and df_diff is not None:
+        df_diff = _index_diff(df_diff).reset_index()
+        df_diff = df_diff[df_diff['module_type'].isin(list_modules_type) & df_diff['parameter'].isin(params)]
+        df_pairs = pd.DataFrame(list(list_trt_diff), columns=['treatment_end', 'treatment_ref'])
+        df_diff = df_diff.merge(df_pairs, on=['treatment_end', 'treatment_ref'])
+        df_min_max = df_diff.groupby('parameter')['rel_diff'].agg(['min','max'])
+        min_max_param = {param: [df_min_max.loc[param,'min'], df_min_max.loc[param,'max']]
+                         for param in params}
+    else:
+        for param in params: # Loop over the parameters
+            val = []
+            for  module_type in list_modules_type: # Loop on the modules type
+                for trt in list_trt_diff: # Loop over the treatmentS
+                    _,y = construct_x_y(df_meta,module_type,trt,param,diff)
+                    val.extend(y)
+            min_max_param [param] =[ min(val),max(val)] 
             
     min_max_param = {param:[y[0] - (ecart := (y[1]-y[0]))/2,y[1] + ecart]
                         for param,y in min_max_param.items()}
@@ -294,15 +405,10 @@ def select_diff_treatment(working_dir,list_mod_selected):
     # Standard library imports
     from itertools import combinations
 
-    #3rd party imports
-    import pandas as pd
-    
     # Internal imports
-    from .PVcharacterization_database import sqlite_to_dataframe
+    from .PVcharacterization_database import catalog_treatments
 
-    df_files_descp = sqlite_to_dataframe(working_dir,GLOBAL['DATA_BASE_TABLE_FILE'])
-    list_treatments = df_files_descp.query('module_type in @list_mod_selected').treatment.unique()
-    list_treatments.sort()
+    list_treatments = catalog_treatments(working_dir,list_mod_selected)
     if len(list_treatments)==1: raise Exception("Sorry, the number of treatments must be >1 ") 
     list_combinations = list(combinations(list_treatments,2))
 
@@ -343,7 +449,8 @@ def plot_params_diff(df_meta,
                      list_params,
                      dic_trt_meaning=None,
                      long_label=False,
-                     plot_params_dict=None):
+                     plot_params_dict=None,
+                     working_dir=None):
                      
     '''Plot len(list_param) times len(list_diff graphics) of the parameters/parameters difference  values versus irradiance
     for each module type.
@@ -355,6 +462,9 @@ def plot_params_diff(df_meta,
        dic_trt_meaning (dict): {Ti: explicit value of Ti}
        long_label: False we truncate the labels
        plot_params_dict (dict): defines the ploting parameters
+       working_dir (str): folder of the database holding the degradation table from which the relative 
+                          variations are read. If None, or if the table does not match df_meta, they are
+                          computed out of df_meta (default: None)
        
     
     '''
@@ -388,7 +498,8 @@ def plot_params_diff(df_meta,
                 plot_params_dict,
                 list_diff = list_diff,
                 dic_trt_meaning=dic_trt_meaning,
-                long_label=long_label,) 
+                long_label=long_label,
+                working_dir=working_dir,) 
     
 def plot_iv_curves(irr_select,name_select,trt_select,working_dir):
 
@@ -553,9 +664,14 @@ def plot_params_diff_Tx(working_dir,
         dic_trt_meaning[treatment[1]] = treatment[1]
         dic_trt_meaning[treatment[0]] = ageing_duration  
 
+        # Relative variations read once for all the parameters
+        df_diff = _read_diff(working_dir, df_meta, module_name_list, list_params, list_diff_treatment) if diff else None
+        
         #  Set ordinates dynamic of the plots (enlarge the irradiance dynamic)
         dic_ylim[idx_module] = _set_ymin_ymax_param(df_meta,list_params, module_name_list,list_diff_treatment,diff,
-                                        limit_type= plot_params_dict['y_limit_type']) 
+                                        limit_type= plot_params_dict['y_limit_type'],
+                                        df_diff=df_diff) 
+        if diff: df_diff = _index_diff(df_diff)
         if idx_module == 1:
             for param in list_params:
                 ylim[param] = [min(dic_ylim[idx_module][param][0], dic_ylim[idx_module-1][param][0])+ylim_min_add,
@@ -569,7 +685,7 @@ def plot_params_diff_Tx(working_dir,
         for idx_param, param in enumerate(list_params): 
 
             # Building the set of values to plot
-            x,y = construct_x_y(df_meta,module_type,treatment,param,diff)
+            x,y = construct_x_y(df_meta,module_type,treatment,param,diff,df_diff=df_diff)
 
             for idx_irr,x_y in enumerate(zip(x,y)):
 
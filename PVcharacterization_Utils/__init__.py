@@ -3,8 +3,11 @@ __author__ = 'F. Bertin, A. Chabli'
 __license__ = "MIT"
 
 from .PVcharacterization_database import *
+from .PVcharacterization_async import *
 from .PVcharacterization_GUI import *
+from .PVcharacterization_ivcurve import *
 from .PVcharacterization_flashtest import *
+from .PVcharacterization_curvestore import *
 from .config import *
 from .PVcharacterization_image import *
 from .PVcharacterization_plot import *
@@ -95,6 +95,10 @@ def _config_pvcharacterization():
     
     
     global_['PARAM_UNIT_DIC']['Rseries'] = chr(937)
+    global_['PARAM_UNIT_DIC']['Rs_fit'] = chr(937)
+    global_['PARAM_UNIT_DIC']['Rsh_fit'] = chr(937)
+    global_['PARAM_UNIT_DIC']['Rs0'] = chr(937)
+    global_['PARAM_UNIT_DIC']['Rsh0'] = chr(937)
        
     return global_
 